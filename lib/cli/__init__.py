@@ -5,7 +5,7 @@ The root of the command line interface for EmpDat
 import sys
 
 from lib.cli.import_csv import import_employees, import_receipts, import_timesheets
-from lib.cli.payroll import run_payroll
+from lib.cli.payroll import run_payroll, preview_payroll
 
 COMMANDS = {
     'import_employees': {
@@ -23,6 +23,10 @@ COMMANDS = {
     'run_payroll': {
         'method': run_payroll,
         'args': 1
+    },
+    'preview_payroll': {
+        'method': preview_payroll,
+        'args': 0
     }
 }
 
@@ -1,17 +1,147 @@
 """
 Import CSV library
+
+Every import commits its rows --commit-every rows at a time, each batch in
+its own transaction, so an interrupted import keeps what it committed.
+Rows that cannot be imported are rejected rather than aborting the import:
+with --rejects, they are written to a CSV file as they are found (see
+ImportReport), otherwise printed.
 """
+import argparse
 import csv
 import datetime
+import multiprocessing
 import os
+import time
+from collections import deque
+from contextlib import ExitStack
+from itertools import islice
 from tkinter import messagebox
 
 from lib.model.employee import Employee
 from lib.model.receipt import Receipt
 from lib.model.timesheet import TimeSheet
+from lib.repository.bulk import UPSERT_CONFLICTS, UPSERT_COUNTS
+from lib.repository.validator import ValidationException
 
+DEFAULT_IMPORT_CHUNK_SIZE = 5000  # CSV lines read at a time
+DEFAULT_IMPORT_RANGE_SIZE = 1024 * 1024  # bytes of an employees file per task
+DEFAULT_COMMIT_EVERY = 5000  # rows per transaction
 
-def _import_csv(filepath: str, has_headers=False):
+
+class ImportReport:
+    """
+    Counts the rows of an import and streams its rejected rows, so memory
+    stays bounded whatever the size of the file. Usage:
+
+        with ImportReport('receipts', rejects_filepath) as report:
+            report.reject(line_number, field, message, row)
+            report.commit(rows_count)
+        print(report.summary())
+
+    Each reject is written as line, field, message, followed by the fields
+    of the row as read. Cutting the first three columns gives a file that
+    can be imported again once fixed.
+    """
+    fields = ['line', 'field', 'message']
+
+    def __init__(self, name, rejects_filepath=None):
+        """
+        :param name: of the rows imported (employees, receipts...)
+        :param rejects_filepath: Optional. CSV file of the rejects (default is the console)
+        """
+        self.name = name
+        self.rejects_filepath = rejects_filepath
+        self.imported = 0
+        self.rejected = 0
+        self.start = time.perf_counter()
+        self.file = None
+        self.writer = None
+
+    def __enter__(self):
+        if self.rejects_filepath:
+            self.file = open(self.rejects_filepath, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.fields + ['row'])
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            self.file.close()
+
+    def reject(self, line, field, message, row):
+        """
+        :param line: line number in the file imported
+        :param field: name of the failing field, or None
+        :param message: str
+        :param row: list of the fields of the row
+        :return: None
+        """
+        self.rejected += 1
+        if self.writer is not None:
+            self.writer.writerow([line, field or '', message, *row])
+        else:
+            print(f'Line {line}: {message}' + (f' ({field})' if field else ''))
+
+    def commit(self, count):
+        """
+        Counts rows committed, and flushes the rejects found so far
+        :param count: int
+        :return: None
+        """
+        self.imported += count
+        if self.file is not None:
+            self.file.flush()
+
+    def summary(self, details=''):
+        """
+        :param details: Optional. Appended to the counts of rows imported
+        :return: str
+        """
+        elapsed = time.perf_counter() - self.start
+        message = f'Imported {self.imported} {self.name} successfully in {elapsed:.2f}s ' \
+                  f'({self.imported / elapsed if elapsed else 0:.0f} rows/second){details}'
+        if self.rejected:
+            message += f'. {self.rejected} rows were rejected'
+            if self.rejects_filepath:
+                message += f', see {self.rejects_filepath}'
+        return message
+
+
+def _parser(prog):
+    """
+    :param prog: name of the command
+    :return: ArgumentParser with the options of every import
+    """
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument('--commit-every', type=int, default=DEFAULT_COMMIT_EVERY)
+    parser.add_argument('--rejects', help='CSV file the rejected rows are written to')
+    return parser
+
+
+def _finish(report, from_cmd, details=''):
+    message = report.summary(details)
+    print(message)
+    if not from_cmd:
+        messagebox.showinfo("showwarning" if report.rejected else "showinfo", message)
+
+
+def _commit(pending, commit_every, write, final=False):
+    """
+    Writes the pending rows commit_every at a time. Only a full batch is
+    written unless final
+    :param pending: list of rows, emptied as they are written
+    :param commit_every: int
+    :param write: function writing a batch of rows in one transaction
+    :param final: Optional. Also write what is left
+    :return: None
+    """
+    while pending and (len(pending) >= commit_every or final):
+        write(pending[:commit_every])
+        del pending[:commit_every]
+
+
+def _check_file(filepath: str):
     if not os.path.exists(filepath):
         raise ValueError('File given does not exist!')
     if not _is_csv(filepath):
@@ -19,116 +149,174 @@ def _import_csv(filepath: str, has_headers=False):
 
     print('Importing from file', filepath)
 
-    i = 0
-    with open(filepath, 'r') as csv_file:
+
+def _import_csv(filepath: str, has_headers=False):
+    """
+    :return: generator of (line number, row)
+    """
+    _check_file(filepath)
+
+    with open(filepath, 'r', newline='') as csv_file:
         reader = csv.reader(csv_file, delimiter=',')
         cursor = 0
         for row in reader:
             if cursor == 0 and has_headers:  # this row is the column names, unneeded
                 cursor += 1
                 continue
-            yield row
-            i += 1
+            yield reader.line_num, row
 
 
-def import_receipts(filepath: str, from_cmd=True):
+def _chunks(rows, size):
     """
-    Imports Receipts in the following format:
+    Splits a stream of rows into lists of size rows
+    :param rows: iterable
+    :param size: int
+    :return: generator of lists
+    """
+    rows = iter(rows)
+    chunk = list(islice(rows, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, size))
 
-    [employee ID],[receipt amount],[receipt amount], ...
 
-    Example:
-        160769,63.02,163.42,140.06,84.15
-        377013,220.89,238.57,218.84
+def _import_values(filepath, repo_cls, columns, to_values, *,  # pylint: disable=too-many-arguments
+                   report, value_name, commit_every=DEFAULT_COMMIT_EVERY,
+                   chunk_size=DEFAULT_IMPORT_CHUNK_SIZE):
+    """
+    Import pipeline of the [employee ID],[value],[value], ... files. The file
+    is streamed chunk_size lines at a time. For each chunk, the employees
+    referenced are fetched with one query and every value is converted.
+    Rows are inserted with insert_values(), commit_every at a time
 
+    A line of an unknown employee is rejected whole, an invalid value is
+    rejected alone (as a line of the employee ID and the value)
 
     :param filepath: path to file
-    :param from_cmd: bool if calling from cmd line
+    :param repo_cls: Repository class type to insert into
+    :param columns: columns set by to_values, after user_id
+    :param to_values: function of a value str returning the values of columns.
+        Raises ValueError for an invalid value
+    :param report: ImportReport
+    :param value_name: name of the values in the file, for the rejects
+    :param commit_every: Optional. Rows per transaction
+    :param chunk_size: Optional. Lines per chunk
     :return: None
     """
-    employees_not_found = []
+    def write(rows):
+        report.commit(repo_cls.insert_values(['user_id', *columns], rows))
 
-    i = 0
-    for row in _import_csv(filepath):
-        employee_id = int(row[0])
+    pending = []
+    for chunk in _chunks(_import_csv(filepath), chunk_size):
+        pending.extend(_chunk_values(chunk, to_values, report, value_name))
+        _commit(pending, commit_every, write)
+    _commit(pending, commit_every, write, final=True)
+
+
+def _chunk_values(chunk, to_values, report, value_name):
+    """
+    Used by _import_values. Converts the values of a chunk of lines, with one
+    query for the employees referenced
+    :param chunk: list of (line number, row)
+    :param to_values: see _import_values
+    :param report: ImportReport the rejects are given to
+    :param value_name: name of the values in the file, for the rejects
+    :return: list of value tuples, the user_id first
+    """
+    employee_ids = Employee.existing_ids(_employee_id(row) for _, row in chunk)
 
-        if not Employee.read(employee_id):
-            print(f'No Employee#{employee_id} exists, ignoring')
-            employees_not_found.append(employee_id)
+    values = []
+    for line, row in chunk:
+        if not row:
+            continue
+        employee_id = _employee_id(row)
+        if employee_id not in employee_ids:
+            report.reject(line, 'user_id', f'No Employee#{row[0]} exists', row)
             continue
 
-        receipts = row[1:]
+        user_id = str(employee_id)
+        for value in row[1:]:
+            try:
+                values.append((user_id, *to_values(value)))
+            except ValueError:
+                report.reject(line, value_name, f'{value!r} is not a number', [row[0], value])
+    return values
 
-        for receipt in receipts:
-            Receipt.create(Receipt({
-                'user_id': employee_id,
-                'amount': receipt
-            }))
-            print('Importing Receipt#', i, 'for Emp#', employee_id)
-            i += 1
 
-    print(f'Imported {i} receipts successfully')
-    if not from_cmd:
-        if len(employees_not_found) > 0:
-            messagebox.showinfo("showwarning", f'Imported {i} receipts '
-            f'successfully. However, the following'
-            f'employee ID\'s were not found: {employees_not_found}')
-        else:
-            messagebox.showinfo("showinfo", f'Imported {i} receipts successfully')
+def _employee_id(row):
+    try:
+        return int(row[0])
+    except (IndexError, ValueError):
+        return None
 
 
-def import_timesheets(filepath: str, from_cmd=True):
+def import_receipts(filepath: str, *options, from_cmd=True,
+                    chunk_size=DEFAULT_IMPORT_CHUNK_SIZE):
     """
-    Imports Timesheets in the following format:
+    Imports Receipts in the following format:
 
-    [employee ID],[time in hours],[time in hours], ...
+    [employee ID],[receipt amount],[receipt amount], ...
 
     Example:
-        426824,7.4,6.5,5.7,8.0,6.9,7.5,6.5,7.5
-        934003,5.8,7.5,5.8,4.8,5.9,4.8,4.0,6.6,5.5,7.2
+        160769,63.02,163.42,140.06,84.15
+        377013,220.89,238.57,218.84
 
+    Options:
+        --commit-every N: receipts per transaction
+        --rejects FILE: CSV file the rejected rows are written to
     :param filepath: path to file
+    :param options: command line options
     :param from_cmd: bool if calling from cmd line
+    :param chunk_size: Optional. Lines read at a time
     :return: None
     """
-    employees_not_found = []
+    options = _parser('import_receipts').parse_args(options)
 
-    i = 0
-    for row in _import_csv(filepath):
-        employee_id = int(row[0])
+    with ImportReport('receipts', options.rejects) as report:
+        _import_values(filepath, Receipt, ['amount'], lambda amount: (float(amount),),
+                       report=report, value_name='amount', commit_every=options.commit_every,
+                       chunk_size=int(chunk_size))
+    _finish(report, from_cmd)
 
-        if not Employee.read(employee_id):
-            print(f'No Employee#{employee_id} exists, ignoring')
-            employees_not_found.append(employee_id)
-            continue
 
-        timesheets = row[1:]
+def import_timesheets(filepath: str, *options, from_cmd=True,
+                      chunk_size=DEFAULT_IMPORT_CHUNK_SIZE):
+    """
+    Imports Timesheets in the following format:
+
+    [employee ID],[time in hours],[time in hours], ...
 
-        for time_in_hours in timesheets:
-            datetime_end = datetime.datetime.now()
-            datetime_begin = datetime_end - datetime.timedelta(
-                seconds=(float(time_in_hours) * 3600)
-            )
+    Example:
+        426824,7.4,6.5,5.7,8.0,6.9,7.5,6.5,7.5
+        934003,5.8,7.5,5.8,4.8,5.9,4.8,4.0,6.6,5.5,7.2
 
-            TimeSheet.create(TimeSheet({
-                'user_id': employee_id,
-                'datetime_end': datetime_end,
-                'datetime_begin': datetime_begin
-            }))
-            print('Importing TimeSheet#', i, 'for Emp#', employee_id)
-            i += 1
+    Every timesheet ends when the import starts.
 
-    print(f'Imported {i} timesheets successfully')
-    if not from_cmd:
-        if len(employees_not_found) > 0:
-            messagebox.showinfo("showwarning", f'Imported {i} timesheets successfully. '
-            f'However, the following'
-            f'employee ID\'s were not found: {employees_not_found}')
-        else:
-            messagebox.showinfo("showinfo", f'Imported {i} timesheets successfully')
+    Options:
+        --commit-every N: timesheets per transaction
+        --rejects FILE: CSV file the rejected rows are written to
+    :param filepath: path to file
+    :param options: command line options
+    :param from_cmd: bool if calling from cmd line
+    :param chunk_size: Optional. Lines read at a time
+    :return: None
+    """
+    options = _parser('import_timesheets').parse_args(options)
+    datetime_end = datetime.datetime.now()
+
+    def to_values(time_in_hours):
+        return datetime_end - datetime.timedelta(seconds=float(time_in_hours) * 3600), \
+            datetime_end
 
+    with ImportReport('timesheets', options.rejects) as report:
+        _import_values(filepath, TimeSheet, ['datetime_begin', 'datetime_end'], to_values,
+                       report=report, value_name='hours', commit_every=options.commit_every,
+                       chunk_size=int(chunk_size))
+    _finish(report, from_cmd)
 
-def import_employees(filename: str, from_cmd=True):
+
+def import_employees(filename: str, *options, from_cmd=True,
+                     range_size=DEFAULT_IMPORT_RANGE_SIZE):
     """
     Imports Employees in the following format:
 
@@ -140,37 +328,213 @@ def import_employees(filename: str, from_cmd=True):
         ID,Name,Address,City,State,Zip,Classification,PayMethod,Salary,Hourly,Commission,Route,Account  # pylint: disable=line-too-long
         688997,Karina Gay,998 Vitae St.,Atlanta,GA,45169,1,1,45884.99,46.92,34,30417353-K,465794-3611  # pylint: disable=line-too-long
 
+    The file is split into byte ranges of about range_size, ending on line
+    boundaries. Each range is parsed and validated on its own, in a process
+    pool with --workers, and this process writes the valid employees in
+    file order. Rows failing validation are rejected with their line
+    number. Ranges being cut on new lines, every employee must be on one
+    line (no quoted field may hold a new line).
+
+    Employees already stored are handled as --on-conflict says: updated
+    (only the changed ones), skipped, or rejected (the default), as are
+    employees given twice. See DatabaseRepository.upsert_values
+
+    Options:
+        --workers N: parses and validates in N processes
+        --on-conflict update|skip|fail: what to do with employees already stored
+        --commit-every N: employees per transaction
+        --rejects FILE: CSV file the rejected rows are written to
     :param filepath: path to file
+    :param options: command line options
     :param from_cmd: bool if calling from cmd line
+    :param range_size: Optional. Bytes of the file parsed at a time
     :return: None
     """
-    i = 0
-    for row in _import_csv(filename, has_headers=True):
-        names = _split_names(row[1])
-        Employee.create(Employee({
-            'id': row[0],
-            'role': 'Viewer',
-            'first_name': names[0],
-            'last_name': names[1],
-            'address_line1': row[2],
-            'address_line2': '',
-            'city': row[3],
-            'state': row[4],
-            'zipcode': row[5],
-            'classification_id': int(row[6]),
-            'paymethod_id': int(row[7]),
-            'salary': row[8],
-            'hourly_rate': row[9],
-            'commission_rate': row[10],
-            'bank_routing': row[11],
-            'bank_account': row[12],
-        }))
-        print('Importing Emp#', row[0])
-        i += 1
-
-    print(f'Imported {i} employees successfully')
-    if not from_cmd:
-        messagebox.showinfo("showinfo", f'Imported {i} employees successfully')
+    options = _employees_parser().parse_args(options)
+
+    _check_file(filename)
+    tasks = _byte_ranges(filename, range_size, skip_header=True)
+
+    counts = dict.fromkeys(UPSERT_COUNTS, 0)
+    columns = None
+
+    def write(rows):
+        with Employee.transaction():
+            if options.on_conflict == 'fail':
+                rows = _reject_stored(report, columns, rows)
+            for key, count in Employee.upsert_values(
+                    columns, [values for _, _, values in rows], options.on_conflict).items():
+                counts[key] += count
+        report.commit(len(rows))
+
+    pending = []
+    with ImportReport('employees', options.rejects) as report, ExitStack() as stack:
+        if options.workers > 1:
+            pool = stack.enter_context(
+                multiprocessing.get_context('spawn').Pool(options.workers))
+            results = _ordered_results(pool, _parse_employees, tasks, 2 * options.workers)
+        else:
+            results = map(_parse_employees, tasks)
+
+        for range_columns, rows in _reject_invalid(report, results):
+            columns = columns or range_columns
+            pending.extend(rows)
+            _commit(pending, options.commit_every, write)
+        _commit(pending, options.commit_every, write, final=True)
+
+    _finish(report, from_cmd, f': {counts["inserted"]} new, {counts["updated"]} updated, '
+                              f'{counts["unchanged"]} unchanged')
+
+
+def _employees_parser():
+    """
+    :return: ArgumentParser of import_employees
+    """
+    parser = _parser('import_employees')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--on-conflict', choices=UPSERT_CONFLICTS, default='fail')
+    return parser
+
+
+def _reject_invalid(report, results):
+    """
+    Used by import_employees. Rejects the invalid rows of each range parsed,
+    numbering their lines from the start of the file
+    :param report: ImportReport
+    :param results: (columns, rows, errors, line count) of each range, in file order.
+        See _parse_employees
+    :return: generator of (columns, valid rows) of each range. Rows are
+        (line number, row, values)
+    """
+    line_number = 2  # of the first line after the headers
+    for columns, rows, errors, line_count in results:
+        for line, field, message, row in errors:
+            report.reject(line_number + line, field, message, row)
+        yield columns, [(line_number + line, row, values) for line, row, values in rows]
+        line_number += line_count
+
+
+def _reject_stored(report, columns, rows):
+    """
+    Used by import_employees with --on-conflict fail. Rejects the employees
+    already stored, with one query, and those given twice
+    :param report: ImportReport
+    :param columns: list of column names of the values
+    :param rows: list of (line number, row, values) from _reject_invalid
+    :return: list of the rows left to insert
+    """
+    id_position = columns.index(Employee.id_attr)
+    stored = Employee.existing_ids(values[id_position] for _, _, values in rows)
+
+    new = []
+    for line, row, values in rows:
+        employee_id = values[id_position]
+        if employee_id in stored:
+            report.reject(line, Employee.id_attr, f'Employee#{employee_id} already exists', row)
+            continue
+        stored.add(employee_id)
+        new.append((line, row, values))
+    return new
+
+
+def _ordered_results(pool, function, tasks, window):
+    """
+    Like pool.imap, results in task order, but never more than window tasks
+    are queued or waiting to be consumed
+    :param pool: Pool
+    :param function: function of one task
+    :param tasks: list
+    :param window: int
+    :return: generator of results
+    """
+    queued = deque()
+    for task in tasks:
+        queued.append(pool.apply_async(function, (task,)))
+        if len(queued) >= window:
+            yield queued.popleft().get()
+    while queued:
+        yield queued.popleft().get()
+
+
+def _byte_ranges(filepath, range_size, skip_header=False):
+    """
+    Splits a file into ranges of about range_size bytes, each ending at the
+    end of a line
+    :param filepath: path to file
+    :param range_size: int
+    :param skip_header: Optional. Leave the first line out
+    :return: list of (filepath, start, end) byte offsets
+    """
+    size = os.path.getsize(filepath)
+    ranges = []
+    with open(filepath, 'rb') as file:
+        start = len(file.readline()) if skip_header else 0
+        while start < size:
+            file.seek(min(start + range_size, size) - 1)
+            file.readline()
+            end = file.tell()
+            ranges.append((filepath, start, end))
+            start = end
+    return ranges
+
+
+def _parse_employees(task):
+    """
+    Parses and validates the employees of one byte range, in a worker
+    process or not
+    :param task: (filepath, start, end) from _byte_ranges
+    :return: (columns, rows, errors, number of lines read). Rows are (line in
+        the range starting at 0, row, values), errors are (line, field or None,
+        message, row)
+    """
+    filepath, start, end = task
+    with open(filepath, 'rb') as file:
+        file.seek(start)
+        lines = file.read(end - start).decode('utf-8').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+
+    columns = None
+    rows = []
+    errors = []
+    reader = csv.reader(lines, delimiter=',')
+    for row in reader:
+        if not row:
+            continue
+        try:
+            values = _employee(row).to_dict()
+        except ValidationException as error:
+            errors.append((reader.line_num - 1, error.database_field, str(error), row))
+            continue
+        except (IndexError, ValueError) as error:
+            errors.append((reader.line_num - 1, None, f'Invalid row: {error}', row))
+            continue
+        columns = columns or list(values)
+        rows.append((reader.line_num - 1, row, tuple(values.get(column) for column in columns)))
+
+    return columns, rows, errors, len(lines)
+
+
+def _employee(row):
+    names = _split_names(row[1])
+    return Employee({
+        'id': row[0],
+        'role': 'Viewer',
+        'first_name': names[0],
+        'last_name': names[1],
+        'address_line1': row[2],
+        'address_line2': '',
+        'city': row[3],
+        'state': row[4],
+        'zipcode': row[5],
+        'classification_id': int(row[6]),
+        'paymethod_id': int(row[7]),
+        'salary': row[8],
+        'hourly_rate': row[9],
+        'commission_rate': row[10],
+        'bank_routing': row[11],
+        'bank_account': row[12],
+    })
 
 
 def _split_names(full_name: str):
@@ -1,30 +1,125 @@
 """
 Manages payroll
 """
-import datetime
+import argparse
+import csv
+import json
+import sys
+import time
 
-from lib.model.employee import Employee, MailMethod, DirectMethod
+from lib.model import eager_loading
+from lib.model.employee import Employee, DirectMethod, MailMethod
+from lib.model.payroll_run import RUNNING
+from lib.payroll import preview_payroll as compute_preview
+from lib.payroll.ledger import find_unfinished_run, start_run, pay_employees, write_output, \
+    last_run_balances, check_output, abandon_run, PayrollException
+from lib.payroll.writers import writers_for
+from lib.repository.db import DatabaseRepository
 
 
-def run_payroll(output_filepath: str):
+def run_payroll(output_filepath: str, *options):
     """
-    Runs payroll
+    Runs payroll. If the last run was interrupted, it is resumed from its
+    checkpoint instead, into its original output file and formats
+
+    Options:
+        --workers N: computes balances in N processes
+        --direct-format FORMAT: writer of direct deposits (csv, jsonl, nacha or text)
+        --mail-format FORMAT: writer of mailed checks (csv, jsonl or text)
+        --abandon: voids the unfinished run instead of resuming it, and starts
+            a new one. See lib.payroll.ledger.abandon_run
+    Payment methods written in different formats get one file each, named
+    after output_filepath (see lib.payroll.writers.output_files)
+
+    Every employee is checked against the writer of their payment method
+    before anything is committed, see lib.payroll.ledger.check_output
     :param output_filepath: file output
+    :param options: command line options
+    :return: list of the paths written, raises PayrollException if an employee
+        cannot be written in the chosen format
+    """
+    parser = argparse.ArgumentParser(prog='run_payroll')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--direct-format', choices=writers_for(DirectMethod.name),
+                        default='text')
+    parser.add_argument('--mail-format', choices=writers_for(MailMethod.name), default='text')
+    parser.add_argument('--abandon', action='store_true')
+    options = parser.parse_args(options)
+
+    start = time.perf_counter()
+    # every employee written out is read whole
+    with DatabaseRepository.connection_scope(), eager_loading():
+        run = find_unfinished_run()
+        if run is not None and options.abandon:
+            abandon_run(run)
+            print(f'Abandoned unfinished payroll run #{run.id}')
+            run = None
+
+        if run is not None:
+            print(f'Resuming unfinished payroll run #{run.id} into {run.output_filepath}')
+            try:
+                check_output(json.loads(run.output_formats))
+            except PayrollException as error:
+                raise PayrollException(f'{error}\nFix them to resume payroll run #{run.id}, '
+                                       f'or start over with --abandon') from error
+        else:
+            formats = {
+                DirectMethod.name: options.direct_format,
+                MailMethod.name: options.mail_format,
+            }
+            check_output(formats)
+            run = start_run(output_filepath, formats)
+
+        if run.status == RUNNING:
+            pay_employees(run, workers=options.workers)
+        filepaths = write_output(run)
+
+    elapsed = time.perf_counter() - start
+    count = run.employees_processed or 0
+    print(f'Paid {count} employees in {elapsed:.2f}s '
+          f'({count / elapsed if elapsed else 0:.0f} employees/second)')
+
+    return filepaths
+
+
+def _write_preview(file, balances, last_balances, names):
+    """
+    Used by preview_payroll. Writes the preview CSV
+    :param file: text file object
+    :param balances: dict of employee ID to balance
+    :param last_balances: dict of employee ID to what the last run paid
+    :param names: dict of employee ID to Employee with their names
     :return: None
     """
-    employees = Employee.read_all()
-    now = datetime.datetime.now()
-    timestamp = now.strftime('%d-%m-%Y %H:%M')
-    with open(output_filepath, 'a') as file:
-        for employee in employees:
-            balance = employee.get_balance()
-
-            if balance > 0:
-                if employee.payment_method.name == MailMethod.name:
-                    file.write(f"[{timestamp}] Mail {balance:.2f} to "
-                            f"{employee.get_name()} to "
-                            f"{employee.address_line1} {employee.city} {employee.zipcode}\n")
-                elif employee.payment_method.name == DirectMethod.name:
-                    file.write(f"[{timestamp}] Transfer {balance:.2f} to "
-                               f"{employee.get_name()} to "
-                               f"{employee.address_line1} {employee.city} {employee.zipcode}\n")
+    writer = csv.writer(file)
+    writer.writerow(['id', 'name', 'balance', 'last_run_balance'])
+    for employee_id, balance in balances.items():
+        last_balance = last_balances.get(employee_id)
+        writer.writerow([
+            employee_id,
+            names[employee_id].get_name() if employee_id in names else '',
+            f'{balance:.2f}',
+            '' if last_balance is None else f'{last_balance:.2f}'
+        ])
+
+
+def preview_payroll(output_filepath: str = None):
+    """
+    Writes what run_payroll would pay each employee as CSV, next to what the
+    last completed run paid them. Nothing is marked paid
+    :param output_filepath: Optional. CSV file output (default is the console)
+    :return: None
+    """
+    with DatabaseRepository.connection_scope():
+        balances = compute_preview()
+        last_balances = last_run_balances()
+        names = Employee.read_many(list(balances), columns=['first_name', 'last_name'])
+
+    if output_filepath:
+        with open(output_filepath, 'w', newline='', encoding='utf-8') as file:
+            _write_preview(file, balances, last_balances, names)
+    else:
+        _write_preview(sys.stdout, balances, last_balances, names)
+
+    print(f'Previewed {len(balances)} employees, '
+          f'{sum(balances.values()):.2f} owed in total', file=sys.stderr)
@@ -54,6 +54,18 @@ class Layer:
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def on_read_columns(self, repo_cls, columns):
+        """
+        Fired when Repository.read_columns() is called.
+        Called before the columns are read, as no model is built to strip fields from.
+
+        :param repo_cls: Repository class type
+        :param columns: Names of the columns to be read
+        :return: None
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def on_update(self, repo_cls, updated_model, id_attr='id'):
         """
@@ -204,6 +204,27 @@ class SecurityLayer(Layer):
         raise NotImplementedError('lib.repository._call_middlewares currently '
                                   'calls on_read_one iteratively')
 
+    def on_read_columns(self, repo_cls, columns):
+        model_name = self._get_model_name_from_repo_cls(repo_cls)
+
+        if CANT_READ not in self.user_role:
+            return
+
+        if '*' in self.user_role[CANT_READ]:
+            raise SecurityException(f'Cannot read this {model_name}! '
+                                    f'Insufficient permission.')
+
+        if model_name in self.user_role[CANT_READ]:
+            cant_read = self.user_role[CANT_READ][model_name]
+            if '*' in cant_read:
+                raise SecurityException(f'Cannot read this {model_name}! '
+                                        f'Insufficient permission.')
+
+            for field in columns:
+                if field in cant_read:
+                    raise SecurityException(f'Reading the {field} field in '
+                                            f'{model_name} records is not allowed')
+
     def on_update(self, repo_cls, updated_model, id_attr='id'):  # pylint: disable=too-many-branches
         """
         Uses dictdiffer to find the differences in the dictionary versions of the
@@ -1,9 +1,15 @@
 """
 Model base classes and traits
 """
+import threading
 from abc import abstractmethod, ABC
+from contextlib import contextmanager
 
 database_models = []
+_cast_plans = {}
+_cast_maps = {}
+_compact_records = {}
+_loading = threading.local()
 
 
 def register_database_model(cls):
@@ -29,6 +35,120 @@ def find_model_by_name(model_name):
     return None
 
 
+@contextmanager
+def eager_loading():
+    """
+    Models created by this thread inside the block cast their fields and load
+    their relationships in their constructor, instead of on first access.
+    Use around code reading every field of every model, like payroll
+    """
+    depth = getattr(_loading, 'eager', 0)
+    _loading.eager = depth + 1
+    try:
+        yield
+    finally:
+        _loading.eager = depth
+
+
+def is_eager_loading():
+    """
+    :return: True inside eager_loading()
+    """
+    return getattr(_loading, 'eager', 0) > 0
+
+
+class CompactRecord:
+    """
+    Read-only record of one row, with a slot per column instead of a data
+    dict. Attributes read like a DynamicModel's: a field that is not set
+    (not selected, or stripped by a layer with delattr) reads None.
+
+    One subclass is generated per model class, see compact_record_class.
+    Use to_model() to get the model back, to call its methods or change it.
+    """
+    __slots__ = ()
+    model: type = None
+
+    def __getattr__(self, key):
+        # only called for fields that are not set, which read None
+        if key.startswith('__'):
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is read-only, use to_model()')
+
+    def __delattr__(self, key):
+        try:
+            object.__delattr__(self, key)
+        except AttributeError:
+            pass
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    @property
+    def data(self):
+        """
+        :return: dict of the fields set, like DynamicModel.data (a copy)
+        """
+        return self.to_dict()
+
+    def to_dict(self):
+        """
+        :return: dict of the fields set
+        """
+        data = {}
+        for key in self.__slots__:
+            try:
+                data[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+        return data
+
+    def to_model(self):
+        """
+        :return: instance of the model class, with the fields set
+        """
+        return self.model(self.to_dict())  # pylint: disable=not-callable
+
+
+def compact_record_class(model_cls, fields):
+    """
+    The CompactRecord class of a model, generated once per model class
+    :param model_cls: model class
+    :param fields: names of every column of the model's table
+    :return: CompactRecord subclass with one slot per field
+    """
+    record_cls = _compact_records.get(model_cls)
+    if record_cls is None:
+        record_cls = type(f'{model_cls.__name__}Record', (CompactRecord,), {
+            '__slots__': tuple(fields),
+            'model': model_cls,
+        })
+        _compact_records[model_cls] = record_cls
+    return record_cls
+
+
+def cast_columns(model_cls, keys, columns):
+    """
+    Batch version of DynamicModel.cast_fields for bulk reads, casting whole
+    columns at once
+    :param model_cls: model class
+    :param keys: field names
+    :param columns: list of column lists, aligned with keys. Replaced in place
+    :return: columns
+    """
+    positions = {key: position for position, key in enumerate(keys)}
+    for field, cast, result_types in model_cls.cast_plan():
+        position = positions.get(field)
+        if position is not None:
+            columns[position] = [
+                value if type(value) in result_types  # pylint: disable=unidiomatic-typecheck
+                else cast(value) for value in columns[position]
+            ]
+    return columns
+
+
 class DynamicModel:
     """
     This Model attribute will allow fields to be completely dynamic
@@ -40,17 +160,39 @@ class DynamicModel:
     """
     reserved_keywords = [
         'data',
+        '_data',
+        '_uncast',
+        '_lazy_relationships',
         '_has_timestamps'
     ]
 
     def __init__(self, data: dict):
         """
-        Sets dynamic data and casts fields as specified
+        Sets dynamic data. Fields are cast on first access, or right away
+        inside eager_loading()
 
         :param data: dict
         """
+        self._uncast = set()  # fields not cast yet
+        self._lazy_relationships = False  # see HasRelationships.defer_relationships
         self.data = data
-        self.cast_fields()
+        if is_eager_loading():
+            self.cast_fields()
+
+    @property
+    def data(self):
+        """
+        :return: dict of the fields, all cast
+        """
+        if self._uncast:
+            self.cast_fields()
+        return self._data
+
+    @data.setter
+    def data(self, data: dict):
+        object.__setattr__(self, '_data', data)
+        self._uncast.clear()
+        self._uncast.update(self.cast_map().keys() & data.keys())
 
     def cast_fields(self):
         """
@@ -68,9 +210,56 @@ class DynamicModel:
             }
         :return: None
         """
-        for field in self.field_casts:
-            if field in self.data:
-                self.data[field] = self.field_casts[field](self.data[field])
+        data = self._data
+        for field, cast, result_types in self.cast_plan():
+            if field in data:
+                value = data[field]
+                if type(value) not in result_types:  # pylint: disable=unidiomatic-typecheck
+                    data[field] = cast(value)
+        self._uncast.clear()
+
+    def _cast_field(self, key):
+        """
+        Casts one field not cast yet, see cast_fields
+        :param key: field name
+        :return: cast value
+        """
+        cast, result_types = self.cast_map()[key]
+        value = self._data[key]
+        if type(value) not in result_types:  # pylint: disable=unidiomatic-typecheck
+            value = self._data[key] = cast(value)
+        self._uncast.discard(key)
+        return value
+
+    @classmethod
+    def cast_plan(cls):
+        """
+        The field_casts of this model class as a list of (field, function,
+        result types) tuples, compiled once per class so hydrating many rows
+        skips the dict lookups. Values already of a result type are not cast.
+        Functions declare their result types with lib.utils.converter, others
+        always run
+        :return: list of tuples
+        """
+        plan = _cast_plans.get(cls)
+        if plan is None:
+            plan = [(field, cast, getattr(cast, 'result_types', ()))
+                    for field, cast in cls.field_casts.items()]
+            _cast_plans[cls] = plan
+        return plan
+
+    @classmethod
+    def cast_map(cls):
+        """
+        The cast_plan as a dict, for casting fields one at a time
+        :return: dict of field: (function, result types)
+        """
+        cast_map = _cast_maps.get(cls)
+        if cast_map is None:
+            cast_map = {field: (cast, result_types)
+                        for field, cast, result_types in cls.cast_plan()}
+            _cast_maps[cls] = cast_map
+        return cast_map
 
     @property
     def __dict__(self):
@@ -94,21 +283,38 @@ class DynamicModel:
     def __getattr__(self, key):
         if key in self.reserved_keywords:
             return super().__getattribute__(key)
-        if key in self.data:
-            return self.data[key]
+        data = self._data
+        if key in data:
+            if key in self._uncast:
+                return self._cast_field(key)
+            return data[key]
+        if self._lazy_relationships and key in self.relationship_fields():
+            self.resolve_relationships()
+            return data.get(key)
         return None
 
     def __setattr__(self, key, value):
         if key in self.reserved_keywords:
             super().__setattr__(key, value)
             return
-        self.data[key] = value
+        if self._lazy_relationships and key in self.relationship_fields():
+            # loading later would overwrite the value set
+            self.resolve_relationships()
+        self._data[key] = value
+        if key in self._uncast:
+            self._uncast.discard(key)
 
     def __delattr__(self, key):
         if key in self.reserved_keywords:
             super().__delattr__(key)
             return
-        del self.data[key]
+        if self._lazy_relationships and key in self.relationship_fields():
+            # loading later would bring the field back
+            self.resolve_relationships()
+        # partial models (see DatabaseRepository._select) may not have the field
+        self._data.pop(key, None)
+        if key in self._uncast:
+            self._uncast.discard(key)
 
     @property
     @classmethod
@@ -196,6 +402,7 @@ class HasRelationships:
     """
     Helps with relational models
     """
+    _lazy_relationships: bool  # set by DynamicModel.__init__
 
     @abstractmethod
     def load_relationships(self):
@@ -205,6 +412,26 @@ class HasRelationships:
         """
         raise NotImplementedError
 
+    def defer_relationships(self):
+        """
+        Loads relationships on the first access of one of the
+        relationship_fields, or right away inside eager_loading()
+        :return: None
+        """
+        if is_eager_loading():
+            self.load_relationships()
+        else:
+            object.__setattr__(self, '_lazy_relationships', True)
+
+    def resolve_relationships(self):
+        """
+        Loads relationships deferred by defer_relationships, once
+        :return: None
+        """
+        if self._lazy_relationships:
+            object.__setattr__(self, '_lazy_relationships', False)
+            self.load_relationships()
+
     @abstractmethod
     def relationship_fields(self) -> list:
         """
@@ -38,20 +38,41 @@ class ChangeRequest(DatabaseRepository, DynamicViewModel, HasRelationships):
     }
 
     def __init__(self, data):
+        """
+        Relationships are not loaded here. Requests read from the database get
+        theirs loaded together, see after_hydrate
+
+        :param data: dict
+        """
         DynamicViewModel.__init__(self, data)
         DatabaseRepository.__init__(self)
 
-        self.load_relationships()
-
     def to_dict(self):
         return self.trim_relationships(DynamicViewModel.to_dict(self))
 
     def load_relationships(self):
-        self.author = Employee.read(self.author_user_id)
-        try:
-            self.approved_by = Employee.read(self.approved_by_user_id)
-        except AttributeError:
-            self.approved_by = None
+        ChangeRequest.load_relationships_many([self])
+
+    @classmethod
+    def load_relationships_many(cls, requests):
+        """
+        Loads the author and approver of many requests with batched
+        Employee lookups instead of two reads per request
+        :param requests: list of ChangeRequest
+        :return: None
+        """
+        employee_ids = []
+        for request in requests:
+            employee_ids += [request.author_user_id, request.approved_by_user_id]
+        employees = Employee.read_many(employee_ids)
+
+        for request in requests:
+            request.author = employees.get(request.author_user_id)
+            request.approved_by = employees.get(request.approved_by_user_id)
+
+    @classmethod
+    def after_hydrate(cls, models):
+        cls.load_relationships_many(models)
 
     def relationship_fields(self):
         return [
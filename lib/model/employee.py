@@ -11,7 +11,7 @@ from lib.model import DynamicViewModel, HasRelationships, register_database_mode
 from lib.model.receipt import Receipt
 from lib.model.timesheet import TimeSheet
 from lib.repository.db import DatabaseRepository
-from lib.utils import sha_hash, date_converter
+from lib.utils import sha_hash, date_converter, float_or_none, int_converter
 
 
 @register_database_model  # pylint: disable=too-many-ancestors
@@ -72,27 +72,32 @@ class Employee(DatabaseRepository, DynamicViewModel, HasRelationships):
         'notes': 'Notes',
     }
     field_casts = {
-        'id': lambda s: int(s),  # pylint: disable=unnecessary-lambda
-        'salary': lambda s: float(s) if s is not None and s != 'None' else None,  # pylint: disable=unnecessary-lambda
-        'hourly_rate': lambda s: float(s) if s is not None and s != 'None' else None,  # pylint: disable=unnecessary-lambda
-        'commission_rate': lambda s: float(s) if s is not None and s != 'None' else None,  # pylint: disable=unnecessary-lambda
-        'start_date': lambda d: date_converter(d), # pylint: disable=unnecessary-lambda
-        'date_of_birth': lambda d: date_converter(d),  # pylint: disable=unnecessary-lambda
-        'date_left': lambda d: date_converter(d)  # pylint: disable=unnecessary-lambda
+        'id': int_converter,
+        'salary': float_or_none,
+        'hourly_rate': float_or_none,
+        'commission_rate': float_or_none,
+        'start_date': date_converter,
+        'date_of_birth': date_converter,
+        'date_left': date_converter,
     }
 
     def __init__(self, data):
         DynamicViewModel.__init__(self, data)
         DatabaseRepository.__init__(self)
 
-        self.load_relationships()
+        self.defer_relationships()
 
     def to_dict(self):
         return self.trim_relationships(DynamicViewModel.to_dict(self))
 
     def load_relationships(self):
-        self.classification = Classification.from_enum(self.classification_id)
-        self.payment_method = PaymentMethod.from_enum(self.paymethod_id)
+        # partial models read without these columns have no relationships
+        classification = Classification.from_enum(self.classification_id) \
+            if self.classification_id is not None else None
+        payment_method = PaymentMethod.from_enum(self.paymethod_id) \
+            if self.paymethod_id is not None else None
+        self.classification = classification  # pylint: disable=attribute-defined-outside-init
+        self.payment_method = payment_method  # pylint: disable=attribute-defined-outside-init
 
     def relationship_fields(self):
         return [
@@ -109,7 +114,8 @@ class Employee(DatabaseRepository, DynamicViewModel, HasRelationships):
 
     def get_balance(self):
         """
-        Gets amount owed to employee. Ran during payroll
+        Gets amount owed to employee and marks their timesheets or receipts paid.
+        See lib.payroll.preview_payroll to only compute balances
         :return: balance float
         """
         if self.classification.name == Hourly.name:
@@ -293,6 +299,34 @@ class Classification:
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def compute_payment(self, employee, hours=0.0, receipts=0.0):
+        """
+        Abstract Method computing a payment from totals already known.
+        Nothing is read or marked as paid
+
+        :param employee: Employee
+        :param hours: unpaid hours worked
+        :param receipts: unpaid receipt amount
+        :return: money owed
+        """
+        raise NotImplementedError
+
+    def unpaid(self, employee_id):  # pylint: disable=unused-argument
+        """
+        Reads what is owed to an employee beyond their salary. Nothing is marked as paid
+        :param employee_id: int
+        :return: (total, IDs of the rows to settle)
+        """
+        return 0.0, []
+
+    def settle(self, row_ids):
+        """
+        Marks rows returned by unpaid() as paid
+        :param row_ids: list of IDs
+        :return: None
+        """
+
     def __str__(self):
         return self.name
 
@@ -344,20 +378,31 @@ class Hourly(Classification):
         This method issues payment to hourly classification
         :returns: money paid to hourly employee
         """
-        money = 0
+        hours, timesheet_ids = self.unpaid(employee_id)
+        self.settle(timesheet_ids)
 
+        return hourly_rate * hours
+
+    def unpaid(self, employee_id):
+        """
+        Reads the unpaid hours of an employee. Nothing is marked as paid
+        :param employee_id: int
+        :return: (hours, timesheet IDs)
+        """
         timesheets = TimeSheet.read_by({
             'user_id': employee_id,
-            'paid': False
+            'paid': False,
+            'pay_period_id': None
         })
-        total = sum([timesheet.to_hours() for timesheet in timesheets])
-        money += hourly_rate * total
+        return sum([timesheet.to_hours() for timesheet in timesheets]), \
+            [timesheet.id for timesheet in timesheets]
 
-        for timesheet in timesheets:
-            timesheet.paid = True
-            TimeSheet.update(timesheet)
+    def settle(self, row_ids):
+        if row_ids:
+            TimeSheet.update_where({'id': [('in', row_ids)]}, {'paid': True})
 
-        return money
+    def compute_payment(self, employee, hours=0.0, receipts=0.0):
+        return employee.hourly_rate * hours
 
 
 @register_classification
@@ -374,6 +419,9 @@ class Salaried(Classification):
         """
         return float(salary) / 24
 
+    def compute_payment(self, employee, hours=0.0, receipts=0.0):
+        return float(employee.salary) / 24
+
 
 @register_classification
 class Commissioned(Classification):
@@ -389,20 +437,31 @@ class Commissioned(Classification):
         :param salary:
         :return: money paid to employee
         """
-        money = salary / 24
+        total, receipt_ids = self.unpaid(employee_id)
+        self.settle(receipt_ids)
+
+        return salary / 24 + total * (commission / 100)
 
+    def unpaid(self, employee_id):
+        """
+        Reads the unpaid receipt amount of an employee. Nothing is marked as paid
+        :param employee_id: int
+        :return: (amount, receipt IDs)
+        """
         receipts = Receipt.read_by({
             'user_id': employee_id,
-            'paid': False
+            'paid': False,
+            'pay_period_id': None
         })
-        total = sum([receipt.amount for receipt in receipts])
-        money += total * (commission / 100)
+        return sum([receipt.amount for receipt in receipts]), \
+            [receipt.id for receipt in receipts]
 
-        for receipt in receipts:
-            receipt.paid = True
-            Receipt.update(receipt)
+    def settle(self, row_ids):
+        if row_ids:
+            Receipt.update_where({'id': [('in', row_ids)]}, {'paid': True})
 
-        return money
+    def compute_payment(self, employee, hours=0.0, receipts=0.0):
+        return employee.salary / 24 + receipts * (employee.commission_rate / 100)
 
 
 class PaymentMethod:
@@ -0,0 +1,65 @@
+"""
+Pay Period Model
+
+Timesheets and receipts belong to the open pay period until a payroll
+closes it: pay_period_id is NULL while open, then set to the closed
+period's ID. Payroll only ever reads the open period's rows, through the
+(pay_period_id, user_id) indexes, so its cost follows the period's
+activity rather than the size of the history.
+
+A payroll run settles rows straight into its own period, left unclosed
+(closed_at NULL) until everyone is paid, so the rows a run paid are
+always known, see lib.payroll.ledger.abandon_run.
+"""
+from sqlalchemy import Table, MetaData, Column, Integer, DateTime, BigInteger
+
+from lib.model import DynamicModel, HasRelationships, register_database_model
+from lib.repository.db import DatabaseRepository
+
+
+@register_database_model
+class PayPeriod(DatabaseRepository, DynamicModel, HasRelationships):
+    """
+    One pay period, closed unless its run is still paying. The watermarks
+    are the highest timesheet and receipt IDs it holds
+    """
+    resource_uri = 'pay_period'
+    field_validators = {
+
+    }
+    field_optional_validators = {
+
+    }
+    field_casts = {
+
+    }
+
+    def __init__(self, data):
+        DynamicModel.__init__(self, data)
+        DatabaseRepository.__init__(self)
+
+    def to_dict(self):
+        return self.trim_relationships(DynamicModel.to_dict(self))
+
+    def load_relationships(self):
+        pass
+
+    def relationship_fields(self) -> list:
+        return []
+
+    @classmethod
+    def new_empty(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def table(cls, metadata=MetaData()) -> Table:
+        return Table(cls.resource_uri, metadata,
+                     Column('id', BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+                     Column('run_id', BigInteger, nullable=True),
+                     Column('timesheet_watermark', BigInteger),
+                     Column('receipt_watermark', BigInteger),
+                     Column('closed_at', DateTime),
+                     Column('created_at', DateTime),
+                     Column('modified_at', DateTime),
+                     extend_existing=True
+                     )
@@ -0,0 +1,113 @@
+"""
+Payroll Run Ledger Models
+"""
+from sqlalchemy import Table, MetaData, Column, String, Integer, DateTime, \
+    Float, BigInteger, Text
+
+from lib.model import DynamicModel, HasRelationships, register_database_model
+from lib.repository.db import DatabaseRepository
+
+RUNNING = 'running'  # employees are being paid in committed batches
+WRITING = 'writing'  # everyone is paid, the output file is being written
+COMPLETE = 'complete'
+ABANDONED = 'abandoned'  # voided by abandon_run, nobody was paid by it
+
+
+@register_database_model
+class PayrollRun(DatabaseRepository, DynamicModel, HasRelationships):
+    """
+    One payroll run. checkpoint_employee_id is the last employee whose
+    payment has been committed
+    """
+    resource_uri = 'payroll_run'
+    field_validators = {
+
+    }
+    field_optional_validators = {
+
+    }
+    field_casts = {
+
+    }
+
+    def __init__(self, data):
+        DynamicModel.__init__(self, data)
+        DatabaseRepository.__init__(self)
+
+    def to_dict(self):
+        return self.trim_relationships(DynamicModel.to_dict(self))
+
+    def load_relationships(self):
+        pass
+
+    def relationship_fields(self) -> list:
+        return []
+
+    @classmethod
+    def new_empty(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def table(cls, metadata=MetaData()) -> Table:
+        return Table(cls.resource_uri, metadata,
+                     Column('id', BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+                     Column('status', String(16), index=True),
+                     Column('output_filepath', String(1024)),
+                     Column('output_formats', String(256), nullable=True),
+                     Column('output_offsets', Text, nullable=True),
+                     Column('timesheet_watermark', BigInteger),
+                     Column('receipt_watermark', BigInteger),
+                     Column('checkpoint_employee_id', BigInteger, nullable=True),
+                     Column('employees_processed', Integer, default=0),
+                     Column('finished_at', DateTime, nullable=True),
+                     Column('created_at', DateTime),
+                     Column('modified_at', DateTime),
+                     extend_existing=True
+                     )
+
+
+@register_database_model
+class PayrollEntry(DatabaseRepository, DynamicModel, HasRelationships):
+    """
+    The balance paid to one employee in a payroll run
+    """
+    resource_uri = 'payroll_entry'
+    field_validators = {
+
+    }
+    field_optional_validators = {
+
+    }
+    field_casts = {
+
+    }
+
+    def __init__(self, data):
+        DynamicModel.__init__(self, data)
+        DatabaseRepository.__init__(self)
+
+    def to_dict(self):
+        return self.trim_relationships(DynamicModel.to_dict(self))
+
+    def load_relationships(self):
+        pass
+
+    def relationship_fields(self) -> list:
+        return []
+
+    @classmethod
+    def new_empty(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def table(cls, metadata=MetaData()) -> Table:
+        return Table(cls.resource_uri, metadata,
+                     Column('id', BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+                     Column('run_id', BigInteger, index=True),
+                     Column('employee_id', BigInteger),
+                     Column('payment_method', String(64)),
+                     Column('balance', Float),
+                     Column('created_at', DateTime),
+                     Column('modified_at', DateTime),
+                     extend_existing=True
+                     )
@@ -2,7 +2,7 @@
 Receipt Model
 """
 from sqlalchemy import Table, MetaData, Column, String, \
-    Integer, DateTime, Boolean, Float, BigInteger
+    Integer, DateTime, Boolean, Float, BigInteger, Index
 
 from lib.model import DynamicModel, HasRelationships, register_database_model
 from lib.repository.db import DatabaseRepository
@@ -56,7 +56,10 @@ class Receipt(DatabaseRepository, DynamicModel, HasRelationships):
                      Column('user_id', String(36)),
                      Column('amount', Float),
                      Column('paid', Boolean, default=False),
+                     # NULL while in the open pay period, see lib.model.pay_period
+                     Column('pay_period_id', BigInteger, nullable=True),
                      Column('created_at', DateTime),
                      Column('modified_at', DateTime),
+                     Index('ix_receipt_pay_period_id_user_id', 'pay_period_id', 'user_id'),
                      extend_existing=True
                      )
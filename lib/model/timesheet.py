@@ -1,7 +1,8 @@
 """
 Timesheet Model
 """
-from sqlalchemy import Table, MetaData, Column, String, Integer, DateTime, Boolean, BigInteger
+from sqlalchemy import Table, MetaData, Column, String, Integer, DateTime, Boolean, BigInteger, \
+    Index
 
 from lib.model import DynamicModel, HasRelationships, register_database_model, DynamicViewModel
 from lib.repository.db import DatabaseRepository
@@ -69,7 +70,10 @@ class TimeSheet(DatabaseRepository, DynamicViewModel, HasRelationships):
                      Column('break_begin', DateTime, nullable=True),
                      Column('break_end', DateTime, nullable=True),
                      Column('paid', Boolean, default=False),
+                     # NULL while in the open pay period, see lib.model.pay_period
+                     Column('pay_period_id', BigInteger, nullable=True),
                      Column('created_at', DateTime),
                      Column('modified_at', DateTime),
+                     Index('ix_timesheet_pay_period_id_user_id', 'pay_period_id', 'user_id'),
                      extend_existing=True
                      )
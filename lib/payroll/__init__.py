@@ -0,0 +1,260 @@
+"""
+Set-based payroll engine
+
+Balances are computed from a few grouped aggregate queries instead of
+reading and updating timesheets and receipts employee by employee:
+    - SUM of unpaid timesheet seconds per timesheet.user_id
+    - SUM of unpaid receipt amounts per receipt.user_id
+Everything is then marked paid with one UPDATE per table, and the pay
+period is closed with one more (see lib.model.pay_period). Only rows of
+the open period are ever read, through the (pay_period_id, user_id)
+indexes.
+
+Rows inserted while a payroll runs are left for the next one: totals and
+settlement only cover rows up to the highest IDs (watermarks) seen when
+the run started.
+
+See lib.payroll.columnar for the vectorized balance computation and
+lib.payroll.ledger for resumable runs paying employees in batches.
+"""
+import datetime
+
+from sqlalchemy import select, func, and_, cast, text, Integer, String
+
+from lib.model.employee import Employee, Hourly, Commissioned
+from lib.model.pay_period import PayPeriod
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.payroll.columnar import load_columns, compute_balances
+
+
+def _max_id(repo_cls):
+    """
+    :param repo_cls: Repository class type
+    :return: highest ID in the table, 0 if empty
+    """
+    table = repo_cls.get_table()
+    rows = repo_cls.run_statement(select([func.max(table.c[repo_cls.id_attr])]))
+    return rows[0][0] or 0
+
+
+def _seconds_expression(table, dialect_name):
+    """
+    SQL expression for the seconds between datetime_begin and datetime_end
+    of a timesheet. SQLite and MySQL count whole seconds (SQLite drops the
+    fractions of both datetimes, MySQL the fraction of the difference),
+    where TimeSheet.to_hours() keeps the microseconds like PostgreSQL does:
+    a timesheet with fractions of seconds can total up to a second less than
+    to_hours(). Whole seconds summed as integers are exact, where julianday()
+    differences drift in the last digits and can tip a half cent
+
+    :param table: timesheet Table object
+    :param dialect_name: name of the database dialect
+    :return: sqlalchemy expression
+    """
+    begin, end = table.c.datetime_begin, table.c.datetime_end
+    if dialect_name == 'sqlite':
+        return cast(func.strftime('%s', end), Integer) - cast(func.strftime('%s', begin), Integer)
+    if dialect_name == 'postgresql':
+        return func.extract('epoch', end - begin)
+    if dialect_name == 'mysql':
+        return func.timestampdiff(text('SECOND'), begin, end)
+    raise NotImplementedError(f'Payroll does not support the {dialect_name} dialect')
+
+
+def _paid_by_classification(table, classification, watermark, employee_range=None):
+    """
+    WHERE clause for the unpaid rows, up to the watermark, of employees
+    with the classification given
+
+    :param table: timesheet or receipt Table object
+    :param classification: Classification class
+    :param watermark: highest ID included
+    :param employee_range: Optional. (first, last) employee IDs included
+    :return: sqlalchemy expression
+    """
+    employee = Employee.get_table()
+    condition = and_(
+        employee.c.classification_id == classification.get_id(),
+        employee.c.id != -1
+    )
+    if employee_range is not None:
+        condition = and_(condition, employee.c.id.between(*employee_range))
+    # user_id is a string column, so the employee IDs are compared as strings
+    return and_(
+        table.c.pay_period_id.is_(None),
+        table.c.paid == False,  # pylint: disable=singleton-comparison
+        table.c.id <= watermark,
+        table.c.user_id.in_(select([cast(employee.c.id, String)]).where(condition))
+    )
+
+
+class Payroll:
+    """
+    One payroll run. Usage:
+
+        payroll = Payroll()
+        for employee, balance in payroll.balances():
+            ...
+        payroll.settle()
+        payroll.close_period()
+    """
+
+    def __init__(self, timesheet_watermark=None, receipt_watermark=None):
+        """
+        :param timesheet_watermark: Optional. Highest timesheet ID included (default is now)
+        :param receipt_watermark: Optional. Highest receipt ID included (default is now)
+        """
+        self.timesheet_watermark = timesheet_watermark if timesheet_watermark is not None \
+            else _max_id(TimeSheet)
+        self.receipt_watermark = receipt_watermark if receipt_watermark is not None \
+            else _max_id(Receipt)
+        self.hours = None
+        self.receipts = None
+
+    def load_totals(self, employee_range=None):
+        """
+        Runs the grouped aggregate queries for unpaid hours and receipts
+        :param employee_range: Optional. (first, last) employee IDs to total (default is everyone)
+        :return: None
+        """
+        timesheet = TimeSheet.get_table()
+        seconds = _seconds_expression(timesheet, TimeSheet.engine.dialect.name)
+        rows = TimeSheet.run_statement(
+            select([timesheet.c.user_id, func.sum(seconds)])
+            .where(_paid_by_classification(timesheet, Hourly, self.timesheet_watermark,
+                                           employee_range))
+            .group_by(timesheet.c.user_id)
+        )
+        self.hours = {int(user_id): float(total) / 3600 for user_id, total in rows}
+
+        receipt = Receipt.get_table()
+        rows = Receipt.run_statement(
+            select([receipt.c.user_id, func.sum(receipt.c.amount)])
+            .where(_paid_by_classification(receipt, Commissioned, self.receipt_watermark,
+                                           employee_range))
+            .group_by(receipt.c.user_id)
+        )
+        self.receipts = {int(user_id): total for user_id, total in rows}
+
+    def balance(self, employee):
+        """
+        Computes an employee's balance from the loaded totals
+        :param employee: Employee
+        :return: balance float
+        """
+        return employee.classification.compute_payment(
+            employee,
+            hours=self.hours.get(employee.id, 0.0),
+            receipts=self.receipts.get(employee.id, 0.0)
+        )
+
+    def balances(self, employees=None):
+        """
+        Computes the balance of every employee. No rows are marked paid
+
+        :param employees: Optional. Iterable of employees (default streams all of them)
+        :return: generator of (employee, balance)
+        """
+        if self.hours is None:
+            self.load_totals()
+        if employees is None:
+            employees = Employee.iter_all()
+
+        for employee in employees:
+            yield employee, self.balance(employee)
+
+    def balance_columns(self, employee_range=None):
+        """
+        Columnar version of balances(): every balance is computed in one
+        vectorized pass and no Employee model is built. No rows are marked paid
+
+        :param employee_range: Optional. (first, last) employee IDs (default is everyone)
+        :return: (EmployeeColumns, list of balances aligned with it)
+        """
+        if self.hours is None:
+            self.load_totals(employee_range)
+        columns = load_columns(employee_range)
+        return columns, compute_balances(columns, self.hours, self.receipts)
+
+    def settle(self, employee_range=None, pay_period_id=None):
+        """
+        Marks the timesheets of hourly employees and the receipts of commissioned
+        employees paid, with one set-based UPDATE per table
+        :param employee_range: Optional. (first, last) employee IDs to settle (default is everyone)
+        :param pay_period_id: Optional. Period the settled rows move to, which records who
+        paid them (default leaves them in the open period)
+        :return: None
+        """
+        values = {'paid': True}
+        if pay_period_id is not None:
+            values['pay_period_id'] = pay_period_id
+
+        with TimeSheet.transaction():
+            for repo_cls, classification, watermark in (
+                    (TimeSheet, Hourly, self.timesheet_watermark),
+                    (Receipt, Commissioned, self.receipt_watermark)):
+                table = repo_cls.get_table()
+                repo_cls.run_statement(
+                    table.update()
+                    .where(_paid_by_classification(table, classification, watermark,
+                                                   employee_range))
+                    .values(**values)
+                )
+
+    def close_period(self, run_id=None, pay_period_id=None):
+        """
+        Closes the open pay period: its timesheets and receipts up to the
+        watermarks, paid or not, move to a new PayPeriod with one UPDATE per table.
+        Call once everyone is settled
+        :param run_id: Optional. ID of the PayrollRun closing the period
+        :param pay_period_id: Optional. Unclosed PayPeriod to close instead of a new one,
+        such as the one settle() moved the run's rows to
+        :return: PayPeriod ID
+        """
+        now = datetime.datetime.now()
+        values = {
+            'run_id': run_id,
+            'timesheet_watermark': self.timesheet_watermark,
+            'receipt_watermark': self.receipt_watermark,
+            'closed_at': now,
+            'modified_at': now
+        }
+
+        with PayPeriod.transaction() as connection:
+            table = PayPeriod.get_table()
+            if pay_period_id is None:
+                result = connection.execute(table.insert().values(created_at=now, **values))
+                pay_period_id = result.inserted_primary_key[0]
+            else:
+                connection.execute(table.update().where(table.c.id == pay_period_id)
+                                   .values(**values))
+
+            for repo_cls, watermark in ((TimeSheet, self.timesheet_watermark),
+                                        (Receipt, self.receipt_watermark)):
+                table = repo_cls.get_table()
+                repo_cls.run_statement(
+                    table.update()
+                    .where(and_(table.c.pay_period_id.is_(None), table.c.id <= watermark))
+                    .values(pay_period_id=pay_period_id)
+                )
+
+        return pay_period_id
+
+
+def preview_payroll(payroll=None):
+    """
+    Computes what the next payroll would pay every employee. Read-only:
+    nothing is marked paid and no run is recorded
+
+    To settle exactly what was previewed, give the same Payroll to settle():
+        payroll = Payroll()
+        balances = preview_payroll(payroll)
+        payroll.settle()
+        payroll.close_period()
+    :param payroll: Optional. Payroll to compute with (default is a new one)
+    :return: dict of employee ID to balance, in employee ID order
+    """
+    payroll = payroll or Payroll()
+    columns, balances = payroll.balance_columns()
+    return dict(zip(columns.ids, balances))
@@ -0,0 +1,420 @@
+"""
+Resumable payroll runs
+
+A run is recorded in the payroll_run table and pays employees in batches,
+in ID order. Each batch commits, in one transaction, the payroll_entry rows
+of its employees, their timesheets and receipts being marked paid and moved
+to the run's pay period, which stays unclosed until everyone is paid, and the
+run's checkpoint. A crash therefore loses at most the batch in flight, and
+a resumed run carries on after the checkpoint without paying anyone twice.
+
+Once everyone is paid, the output files are written from the entries, by
+the writer chosen for each payment method (see lib.payroll.writers). The
+size of each file is recorded before the run first writes to it, so a crash
+while writing is recovered by truncating back to it and writing again. A run that should
+not be resumed, say to change its formats, is voided with abandon_run. Formats are
+validated, and every employee checked by the writer of their payment
+method (see check_output), before a run is recorded or resumed, so
+writing cannot fail on data committed batches depend on.
+
+Balances can be computed by a pool of worker processes, each with its own
+database connection, given batches as ranges of employee IDs. The batches
+are still committed one after the other, in ID order, by the calling
+process, so the ledger and the output are the same with any number of
+workers.
+
+Ledger rows are system records: they are written directly, like
+run_statement, without calling layers.
+"""
+import datetime
+import json
+import multiprocessing
+import os
+from contextlib import ExitStack
+
+from lib.model.employee import Employee, pay_methods
+from lib.model.pay_period import PayPeriod
+from lib.model.payroll_run import PayrollRun, PayrollEntry, RUNNING, WRITING, COMPLETE, \
+    ABANDONED
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.payroll import Payroll
+from lib.payroll.writers import writers, writers_for, output_files, FILE_BUFFER_SIZE
+from lib.repository.db import database_setup, DatabaseRepository
+
+DEFAULT_BATCH_SIZE = 500  # employees per committed batch
+MAX_REPORTED_PROBLEMS = 20
+
+
+class PayrollException(Exception):
+    """
+    Thrown when a payroll run cannot be started or resumed
+    """
+
+
+def validate_formats(formats):
+    """
+    :param formats: dict of payment method name to writer name
+    :return: raises PayrollException if a writer cannot write its method's payments
+    """
+    for method, writer_name in formats.items():
+        if writer_name not in writers_for(method):
+            raise PayrollException(f'{writer_name} cannot write {method} payments, '
+                                   f'choose one of {", ".join(writers_for(method))}')
+
+
+def check_output(formats):
+    """
+    Checks every employee against the writer of their payment method, see
+    PaymentWriter.check. Nothing is written
+    :param formats: dict of payment method name to writer name
+    :return: raises PayrollException listing the employees that cannot be written
+    """
+    problems = []
+    for method in pay_methods:
+        writer = writers[formats[method.name]]
+        if not writer.checked_columns:
+            continue
+        employees = Employee.iter_by({'id': [('!=', -1)], 'paymethod_id': method.get_id()},
+                                     columns=list(writer.checked_columns), compact=True)
+        for employee in employees:
+            problem = writer.check(employee)
+            if problem is not None:
+                problems.append(f'Employee#{employee.id}: {problem}')
+
+    if problems:
+        shown = problems[:MAX_REPORTED_PROBLEMS]
+        if len(problems) > len(shown):
+            shown.append(f'... and {len(problems) - len(shown)} more')
+        raise PayrollException(f'{len(problems)} employees cannot be paid in the chosen '
+                               f'formats:\n' + '\n'.join(shown))
+
+
+def find_unfinished_run():
+    """
+    :return: the latest PayrollRun that did not complete, or None
+    """
+    runs = PayrollRun.read_by({'status': [('in', [RUNNING, WRITING])]}, order_by='-id',
+                              limit=1)
+    return runs[0] if runs else None
+
+
+def abandon_run(run):
+    """
+    Voids an unfinished run so that a new one can start: the timesheets and
+    receipts in its pay period, which holds every row it marked paid, go back
+    to the open period unpaid, its entries are deleted and the output files it began
+    writing are truncated back to their size before it
+    :param run: PayrollRun with the RUNNING or WRITING status
+    :return: None
+    """
+    with PayrollRun.transaction():
+        periods = PayPeriod.read_by({'run_id': run.id}, columns=[])
+        if periods:
+            for repo_cls in (TimeSheet, Receipt):
+                repo_cls.update_where(
+                    {'pay_period_id': [('in', [period.id for period in periods])]},
+                    {'pay_period_id': None, 'paid': False})
+        for repo_cls, column, value in ((PayPeriod, 'run_id', run.id),
+                                        (PayrollEntry, 'run_id', run.id)):
+            table = repo_cls.get_table()
+            repo_cls.run_statement(table.delete().where(table.c[column] == value))
+        PayrollRun.update_where({'id': run.id}, {
+            'status': ABANDONED,
+            'finished_at': datetime.datetime.now(),
+        })
+    run.status = ABANDONED
+
+    for filepath, offset in json.loads(run.output_offsets or '{}').items():
+        if offset is not None and os.path.exists(filepath) \
+                and os.path.getsize(filepath) > offset:
+            os.truncate(filepath, offset)
+
+
+def last_run_balances():
+    """
+    Balances of the latest completed run, to compare a preview against
+    :return: dict of employee ID to balance, empty if no run completed
+    """
+    runs = PayrollRun.read_by({'status': COMPLETE}, order_by='-id', limit=1)
+    if not runs:
+        return {}
+    entries = PayrollEntry.read_columns(['employee_id', 'balance'], {'run_id': runs[0].id})
+    return dict(zip(entries['employee_id'], entries['balance']))
+
+
+def start_run(output_filepath: str, formats=None):
+    """
+    Records a new payroll run. Timesheets and receipts added after this
+    are left for the next run. See check_output to check employees first
+    :param output_filepath: file output
+    :param formats: Optional. dict of payment method name to writer name (default is text)
+    :return: PayrollRun, raises PayrollException if a format is not valid
+    """
+    formats = {**{method.name: 'text' for method in pay_methods}, **(formats or {})}
+    validate_formats(formats)
+    payroll = Payroll()
+    now = datetime.datetime.now()
+    table = PayrollRun.get_table()
+
+    with PayrollRun.transaction() as connection:
+        result = connection.execute(table.insert().values(
+            status=RUNNING,
+            output_filepath=output_filepath,
+            output_formats=json.dumps(formats),
+            output_offsets=json.dumps({}),
+            timesheet_watermark=payroll.timesheet_watermark,
+            receipt_watermark=payroll.receipt_watermark,
+            checkpoint_employee_id=None,
+            employees_processed=0,
+            created_at=now,
+            modified_at=now
+        ))
+
+    return PayrollRun.read(result.inserted_primary_key[0])
+
+
+def pay_employees(run, batch_size=DEFAULT_BATCH_SIZE, workers=1):
+    """
+    Pays every employee after the run's checkpoint, one committed batch at a time
+    :param run: PayrollRun with the RUNNING status
+    :param batch_size: Optional. Employees per transaction
+    :param workers: Optional. Processes computing balances (default computes them here)
+    :return: None
+    """
+    payroll = Payroll(run.timesheet_watermark, run.receipt_watermark)
+    pay_period_id = _run_period(run)
+    tasks = [(run.timesheet_watermark, run.receipt_watermark, first_id, last_id)
+             for first_id, last_id in _employee_ranges(run.checkpoint_employee_id, batch_size)]
+
+    if workers > 1:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=_init_worker,
+                          initargs=(DatabaseRepository.config,)) as pool:
+            # imap hands results back in task order, whichever worker finishes first
+            for task, entries in zip(tasks, pool.imap(_compute_range, tasks)):
+                commit_batch(run, payroll, entries, task[2:], pay_period_id)
+    else:
+        for task in tasks:
+            commit_batch(run, payroll, _compute_range(task), task[2:], pay_period_id)
+
+    with PayrollRun.transaction():
+        payroll.close_period(run.id, pay_period_id)
+        PayrollRun.update_where({'id': run.id}, {'status': WRITING})
+    run.status = WRITING
+
+
+def compute_entries(payroll, employee_range):
+    """
+    Computes the balances of one batch of employees. Nothing is written
+    :param payroll: Payroll with the run's watermarks
+    :param employee_range: (first, last) IDs of the batch
+    :return: list of entry dicts (employee_id, payment_method, balance)
+    """
+    payroll.load_totals(employee_range)
+    columns, balances = payroll.balance_columns(employee_range)
+    return [{
+        'employee_id': employee_id,
+        'payment_method': payment_method,
+        'balance': balance,
+    } for employee_id, payment_method, balance in zip(
+        columns.ids, columns.payment_method_names(), balances)]
+
+
+def commit_batch(run, payroll, entries, employee_range, pay_period_id):
+    """
+    Commits the entries of one batch, marks their timesheets and receipts paid
+    in the run's pay period, and moves the run's checkpoint, in one transaction
+    :param run: PayrollRun
+    :param payroll: Payroll with the run's watermarks
+    :param entries: list of entry dicts from compute_entries
+    :param employee_range: (first, last) IDs of the batch. The last one is the new checkpoint
+    :param pay_period_id: ID of the run's unclosed PayPeriod, see _run_period
+    :return: None
+    """
+    now = datetime.datetime.now()
+
+    with PayrollRun.transaction() as connection:
+        if entries:
+            connection.execute(PayrollEntry.get_table().insert(), [
+                {**entry, 'run_id': run.id, 'created_at': now, 'modified_at': now}
+                for entry in entries
+            ])
+            payroll.settle(employee_range, pay_period_id)
+        run.employees_processed = (run.employees_processed or 0) + len(entries)
+        run.checkpoint_employee_id = employee_range[1]
+        PayrollRun.update_where({'id': run.id}, {
+            'checkpoint_employee_id': run.checkpoint_employee_id,
+            'employees_processed': run.employees_processed,
+        })
+
+
+def _run_period(run):
+    """
+    The pay period a run's batches settle rows into. It is created unclosed by
+    the first call and closed by close_period once everyone is paid
+    :param run: PayrollRun
+    :return: PayPeriod ID
+    """
+    periods = PayPeriod.read_by({'run_id': run.id}, columns=[], limit=1)
+    if periods:
+        return periods[0].id
+
+    now = datetime.datetime.now()
+    with PayPeriod.transaction() as connection:
+        result = connection.execute(PayPeriod.get_table().insert().values(
+            run_id=run.id,
+            timesheet_watermark=run.timesheet_watermark,
+            receipt_watermark=run.receipt_watermark,
+            closed_at=None,
+            created_at=now,
+            modified_at=now
+        ))
+    return result.inserted_primary_key[0]
+
+
+def _after(checkpoint):
+    """
+    :param checkpoint: last employee ID paid, or None
+    :return: read_by expressions for the employee IDs left to pay
+    """
+    expressions = [('!=', -1)]
+    if checkpoint is not None:
+        expressions.append(('>', checkpoint))
+    return expressions
+
+
+def _employee_ranges(checkpoint, batch_size):
+    """
+    Splits the employees left to pay into batches of consecutive IDs
+    :param checkpoint: last employee ID paid, or None
+    :param batch_size: employees per batch
+    :return: generator of (first_id, last_id)
+    """
+    ids = Employee.read_by({'id': _after(checkpoint)}, limit=batch_size, columns=[])
+    while ids:
+        yield ids[0].id, ids[-1].id
+        if ids.next_cursor is None:
+            break
+        ids = Employee.read_by({'id': _after(checkpoint)}, limit=batch_size, columns=[],
+                               after=ids.next_cursor)
+
+
+def _init_worker(config):
+    """
+    Gives a worker process its own engine and connections
+    :param config: database config of the parent process
+    :return: None
+    """
+    database_setup(config)
+
+
+def _compute_range(task):
+    """
+    Computes one batch of pay_employees, in a worker process or not
+    :param task: (timesheet watermark, receipt watermark, first employee ID, last employee ID)
+    :return: list of entry dicts from compute_entries
+    """
+    timesheet_watermark, receipt_watermark, first_id, last_id = task
+    return compute_entries(Payroll(timesheet_watermark, receipt_watermark), (first_id, last_id))
+
+
+def _record_offsets(run, formats, files):
+    """
+    Used by write_output. Records the size of each output file the run has
+    not written to yet, before anything is written, so that an interrupted
+    attempt is cut back to it and abandon_run leaves untouched files alone.
+    Writers that do not append start their file over, from offset 0
+    :param run: PayrollRun
+    :param formats: dict of payment method name to writer name
+    :param files: dict of payment method name to output file path
+    :return: dict of output file path to offset
+    """
+    offsets = json.loads(run.output_offsets or '{}')
+    recorded = dict(offsets)
+    for method, filepath in files.items():
+        if offsets.get(filepath) is None:
+            offsets[filepath] = os.path.getsize(filepath) \
+                if writers[formats[method]].appends and os.path.exists(filepath) else 0
+
+    if offsets != recorded:
+        run.output_offsets = json.dumps(offsets)
+        PayrollRun.update_where({'id': run.id}, {'output_offsets': run.output_offsets})
+    return offsets
+
+
+def _begin_writer(writer_cls, file, run, offset):
+    """
+    Used by write_output. Cuts an output file back to the offset recorded for
+    the run, which drops whatever an interrupted attempt managed to
+    write, and begins its writer
+    :param writer_cls: PaymentWriter class
+    :param file: text file object opened for appending
+    :param run: PayrollRun
+    :param offset: size of the file before the run wrote to it, see _record_offsets
+    :return: PaymentWriter
+    """
+    file.truncate(offset)
+    writer = writer_cls(file, run.created_at)
+    writer.begin(offset == 0)
+    return writer
+
+
+def _write_entries(run, method_writers, batch_size):
+    """
+    Used by write_output. Writes the run's payments, batch_size entries at a time
+    :param run: PayrollRun
+    :param method_writers: dict of payment method to PaymentWriter
+    :param batch_size: entries read at a time
+    :return: None
+    """
+    filters = {'run_id': run.id, 'balance': [('>', 0)]}
+    entries = PayrollEntry.read_by(filters, limit=batch_size)
+    while entries:
+        employees = Employee.read_many([entry.employee_id for entry in entries])
+        for entry in entries:
+            employee = employees.get(entry.employee_id)
+            if employee is None:
+                print(f'Employee#{entry.employee_id} no longer exists, '
+                      f'{entry.balance:.2f} left out of the output')
+                continue
+            writer = method_writers.get(entry.payment_method)
+            if writer is not None:
+                writer.write(employee, entry.balance, entry.payment_method)
+
+        if entries.next_cursor is None:
+            break
+        entries = PayrollEntry.read_by(filters, limit=batch_size, after=entries.next_cursor)
+
+
+def write_output(run, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Writes the run's payments to its output files and completes the run
+    :param run: PayrollRun with the WRITING status
+    :param batch_size: Optional. Entries read at a time
+    :return: list of the paths written
+    """
+    formats = json.loads(run.output_formats)
+    files = output_files(run.output_filepath, formats)
+    offsets = _record_offsets(run, formats, files)
+
+    with ExitStack() as stack:
+        file_writers = {}
+        for method, filepath in files.items():
+            if filepath not in file_writers:
+                file = stack.enter_context(open(filepath, 'a', buffering=FILE_BUFFER_SIZE,
+                                                newline='', encoding='utf-8'))
+                file_writers[filepath] = _begin_writer(writers[formats[method]], file, run,
+                                                       offsets[filepath])
+        _write_entries(run, {method: file_writers[filepath] for method, filepath in files.items()},
+                       batch_size)
+        for writer in file_writers.values():
+            writer.end()
+
+    PayrollRun.update_where({'id': run.id}, {
+        'status': COMPLETE,
+        'finished_at': datetime.datetime.now(),
+    })
+    run.status = COMPLETE
+
+    return list(file_writers)
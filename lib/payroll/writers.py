@@ -0,0 +1,347 @@
+"""
+Payroll output writers
+
+A writer streams the payments of a run into one file, in one format.
+Lines are buffered and written BUFFER_LINES at a time, so nothing is
+held in memory beyond one buffer whatever the size of the payroll.
+
+Formats (see register_writer):
+    text: the historical "[date] Mail 12.00 to ..." lines
+    csv: one row per payment, with a header row when the file is empty
+    jsonl: one JSON object per payment
+    nacha: NACHA-like fixed width direct deposit (ACH) file. Only for
+        the Direct Deposit payment method, as it needs the bank routing
+        and account of each employee
+
+Writers needing more of an employee than a name and address check every
+employee before a run commits anything, see PaymentWriter.check
+"""
+import csv
+import io
+import json
+import os
+import re
+from abc import abstractmethod
+
+from lib.model.employee import DirectMethod
+
+BUFFER_LINES = 1000
+FILE_BUFFER_SIZE = 64 * 1024
+
+# originator fields of the NACHA-like file
+ACH_COMPANY_NAME = 'EMPDAT'
+ACH_COMPANY_ID = '0000000000'
+ACH_ORIGIN_ROUTING = '000000000'
+ACH_DESTINATION_ROUTING = '000000000'
+ACH_RECORD_SIZE = 94
+ACH_BLOCKING_FACTOR = 10
+
+writers = {}
+
+
+def register_writer(cls):
+    """
+    Decorator that adds a writer to the registry, by its name
+    :param cls: class
+    :return: Class
+    """
+    writers[cls.name] = cls
+    return cls
+
+
+def writers_for(payment_method_name):
+    """
+    :param payment_method_name: name of a payment method
+    :return: sorted names of the writers able to write its payments
+    """
+    return sorted(name for name, cls in writers.items()
+                  if cls.payment_methods is None or payment_method_name in cls.payment_methods)
+
+
+def routing_number(value):
+    """
+    Normalizes a bank routing number: spaces, dashes and dots are dropped,
+    and what is left must be 9 digits with a valid ABA check digit
+    :param value: bank_routing of an employee
+    :return: 9 digit str, or None if it is not a routing number
+    """
+    digits = re.sub(r'[\s.\-]', '', str(value or ''))
+    if not re.fullmatch('[0-9]{9}', digits):
+        return None
+    if sum(int(digit) * weight for digit, weight in zip(digits, (3, 7, 1) * 3)) % 10:
+        return None
+    return digits
+
+
+def output_files(output_filepath, formats):
+    """
+    Decides which file each payment method is written to. Methods all
+    written in one format share output_filepath. Otherwise each method
+    gets a file named after it, next to output_filepath
+
+    :param output_filepath: file output asked for
+    :param formats: dict of payment method name to writer name
+    :return: dict of payment method name to file path
+    """
+    if len(set(formats.values())) <= 1:
+        return {method: output_filepath for method in formats}
+
+    root, _ = os.path.splitext(output_filepath)
+    return {
+        method: f"{root}_{re.sub('[^a-z0-9]+', '_', method.lower())}"
+                f"{writers[writer_name].extension}"
+        for method, writer_name in formats.items()
+    }
+
+
+class PaymentWriter:
+    """
+    Abstract writer. Usage:
+
+        writer = CsvWriter(file, timestamp)
+        writer.begin(file_is_empty)
+        writer.write(employee, balance, payment_method_name)
+        writer.end()
+    """
+    name: str = ''
+    extension: str = '.txt'
+    appends: bool = True  # payments go after what the file already holds
+    payment_methods: tuple = None  # names of the methods it can write, None for all
+    checked_columns: tuple = ()  # employee columns read by check(), none to skip it
+
+    def __init__(self, file, timestamp):
+        """
+        :param file: text file object opened for appending
+        :param timestamp: datetime of the run
+        """
+        self.file = file
+        self.timestamp = timestamp
+        self.lines = []
+
+    @classmethod
+    def check(cls, employee):  # pylint: disable=unused-argument
+        """
+        Tells whether an employee can be written, before the run commits anything
+        :param employee: Employee or CompactRecord with the checked_columns
+        :return: why the employee cannot be written, None if they can
+        """
+        return None
+
+    def begin(self, file_is_empty):
+        """
+        Writes what comes before the payments
+        :param file_is_empty: bool
+        :return: None
+        """
+
+    @abstractmethod
+    def format(self, employee, balance, payment_method_name):
+        """
+        :param employee: Employee
+        :param balance: float
+        :param payment_method_name: str
+        :return: line str, ending with a new line
+        """
+        raise NotImplementedError
+
+    def write(self, employee, balance, payment_method_name):
+        """
+        Buffers one payment
+        :param employee: Employee
+        :param balance: float
+        :param payment_method_name: str
+        :return: None
+        """
+        self.lines.append(self.format(employee, balance, payment_method_name))
+        if len(self.lines) >= BUFFER_LINES:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered lines
+        :return: None
+        """
+        self.file.writelines(self.lines)
+        self.lines = []
+
+    def end(self):
+        """
+        Writes what comes after the payments and flushes
+        :return: None
+        """
+        self.flush()
+
+
+@register_writer
+class TextWriter(PaymentWriter):
+    """
+    [date] Mail 12.00 to John Doe to 123 Main St. Orem 84058
+    """
+    name = 'text'
+    extension = '.txt'
+
+    verbs = {
+        'Mail': 'Mail',
+        'Direct Deposit': 'Transfer',
+    }
+
+    def __init__(self, file, timestamp):
+        super().__init__(file, timestamp)
+        self.date = timestamp.strftime('%d-%m-%Y %H:%M')
+
+    def format(self, employee, balance, payment_method_name):
+        verb = self.verbs.get(payment_method_name, payment_method_name)
+        return (f"[{self.date}] {verb} {balance:.2f} to "
+                f"{employee.get_name()} to "
+                f"{employee.address_line1} {employee.city} {employee.zipcode}\n")
+
+
+@register_writer
+class CsvWriter(PaymentWriter):
+    """
+    One row per payment
+    """
+    name = 'csv'
+    extension = '.csv'
+
+    fields = ['date', 'employee_id', 'name', 'payment_method', 'amount',
+              'address_line1', 'city', 'state', 'zipcode']
+
+    def __init__(self, file, timestamp):
+        super().__init__(file, timestamp)
+        self.date = timestamp.isoformat(sep=' ', timespec='minutes')
+        self.row = io.StringIO()
+        self.writer = csv.writer(self.row, lineterminator='\n')
+
+    def begin(self, file_is_empty):
+        if file_is_empty:
+            self.lines.append(self._row(self.fields))
+
+    def _row(self, values):
+        self.writer.writerow(values)
+        line = self.row.getvalue()
+        self.row.seek(0)
+        self.row.truncate()
+        return line
+
+    def format(self, employee, balance, payment_method_name):
+        return self._row([self.date, employee.id, employee.get_name(), payment_method_name,
+                          f'{balance:.2f}', employee.address_line1, employee.city,
+                          employee.state, employee.zipcode])
+
+
+@register_writer
+class JsonLinesWriter(PaymentWriter):
+    """
+    One JSON object per payment
+    """
+    name = 'jsonl'
+    extension = '.jsonl'
+
+    def __init__(self, file, timestamp):
+        super().__init__(file, timestamp)
+        self.date = timestamp.isoformat(timespec='minutes')
+
+    def format(self, employee, balance, payment_method_name):
+        return json.dumps({
+            'date': self.date,
+            'employee_id': employee.id,
+            'name': employee.get_name(),
+            'payment_method': payment_method_name,
+            'amount': round(balance, 2),
+            'address_line1': employee.address_line1,
+            'city': employee.city,
+            'state': employee.state,
+            'zipcode': employee.zipcode,
+        }) + '\n'
+
+
+def _alpha(value, size):
+    return str(value or '').upper()[:size].ljust(size)
+
+
+def _numeric(value, size):
+    return str(value or 0)[-size:].rjust(size, '0')
+
+
+@register_writer
+class NachaWriter(PaymentWriter):
+    """
+    NACHA-like fixed width file: one batch of PPD credits (transaction
+    code 22, checking deposit) between the file and batch header and
+    control records, padded to a block of 10 records. Each run writes
+    its own file
+    """
+    name = 'nacha'
+    extension = '.ach'
+    appends = False
+    payment_methods = (DirectMethod.name,)
+    checked_columns = ('bank_routing', 'bank_account')
+
+    def __init__(self, file, timestamp):
+        super().__init__(file, timestamp)
+        self.entries = 0
+        self.entry_hash = 0
+        self.credit_total = 0
+        self.records = 0
+
+    @classmethod
+    def check(cls, employee):
+        if routing_number(employee.bank_routing) is None:
+            return f'bank routing {employee.bank_routing!r} is not a valid 9 digit routing number'
+        if not employee.bank_account:
+            return 'no bank account'
+        return None
+
+    def _record(self, record):
+        self.records += 1
+        return record + '\n'
+
+    def begin(self, file_is_empty):
+        date = self.timestamp.strftime('%y%m%d')
+        self.lines.append(self._record(
+            '101'
+            + ' ' + _numeric(ACH_DESTINATION_ROUTING, 9)
+            + ' ' + _numeric(ACH_ORIGIN_ROUTING, 9)
+            + date + self.timestamp.strftime('%H%M')
+            + 'A094101'
+            + _alpha('', 23) + _alpha(ACH_COMPANY_NAME, 23) + _alpha('', 8)
+        ))
+        self.lines.append(self._record(
+            '5220'
+            + _alpha(ACH_COMPANY_NAME, 16) + _alpha('', 20) + _numeric(ACH_COMPANY_ID, 10)
+            + 'PPD' + _alpha('PAYROLL', 10) + date + date
+            + '   1' + _numeric(ACH_ORIGIN_ROUTING, 9)[:8] + _numeric(1, 7)
+        ))
+
+    def format(self, employee, balance, payment_method_name):
+        routing = routing_number(employee.bank_routing)
+        if routing is None:
+            raise ValueError(f'Employee#{employee.id}: {self.check(employee)}')
+        cents = int(round(balance * 100))
+        self.entries += 1
+        self.entry_hash += int(routing[:8])
+        self.credit_total += cents
+        return self._record(
+            '622' + routing
+            + _alpha(employee.bank_account, 17) + _numeric(cents, 10)
+            + _alpha(employee.id, 15) + _alpha(employee.get_name(), 22)
+            + '  0' + _numeric(ACH_ORIGIN_ROUTING, 9)[:8] + _numeric(self.entries, 7)
+        )
+
+    def end(self):
+        entry_hash = _numeric(self.entry_hash % 10 ** 10, 10)
+        self.lines.append(self._record(
+            '8220' + _numeric(self.entries, 6) + entry_hash
+            + _numeric(0, 12) + _numeric(self.credit_total, 12)
+            + _numeric(ACH_COMPANY_ID, 10) + _alpha('', 25)
+            + _numeric(ACH_ORIGIN_ROUTING, 9)[:8] + _numeric(1, 7)
+        ))
+        blocks = -(-(self.records + 1) // ACH_BLOCKING_FACTOR)
+        self.lines.append(self._record(
+            '9' + _numeric(1, 6) + _numeric(blocks, 6) + _numeric(self.entries, 8) + entry_hash
+            + _numeric(0, 12) + _numeric(self.credit_total, 12) + _alpha('', 39)
+        ))
+        while self.records % ACH_BLOCKING_FACTOR:
+            self.lines.append(self._record('9' * ACH_RECORD_SIZE))
+        super().end()
@@ -24,21 +24,28 @@ def _call_layers(action, repo_cls, model_id=None, new_model=None, id_attr='id'):
     if action == 'create':
         for layer in layers:
             layer.on_create(repo_cls, new_model)
-        return
-    if action == 'read_one':
+    elif action == 'create_many':
+        for model in new_model:
+            for layer in layers:
+                layer.on_create(repo_cls, model)
+    elif action == 'read_one':
         for layer in layers:
             layer.on_read_one(repo_cls, new_model)
-        return
-    if action == 'read_many':
+    elif action == 'read_many':
         for model in new_model:
             for layer in layers:
                 layer.on_read_one(repo_cls, model)
-        return
-    if action == 'update':
+    elif action == 'read_columns':
+        for layer in layers:
+            layer.on_read_columns(repo_cls, new_model)
+    elif action == 'update':
         for layer in layers:
             layer.on_update(repo_cls, new_model, id_attr=id_attr)
-        return
-    if action == 'destroy':
+    elif action == 'update_many':
+        for model in new_model:
+            for layer in layers:
+                layer.on_update(repo_cls, model, id_attr=id_attr)
+    elif action == 'destroy':
         for layer in layers:
             layer.on_destroy(repo_cls, model_id, id_attr=id_attr)
     else:
@@ -89,6 +96,19 @@ class Repository(CanMutateData):
         """
         _call_layers('create', cls, new_model=model)
 
+    @classmethod
+    def on_create_many(cls, models):
+        """
+        Calls the on_create method on all registered layers for every model
+        before any of them are created
+
+        Repository implementations MUST call this manually, as layers
+        are an opt-in process
+        :param models: models to be created
+        :return: None
+        """
+        _call_layers('create_many', cls, new_model=models)
+
     @classmethod
     def on_update(cls, model):
         """
@@ -101,6 +121,32 @@ class Repository(CanMutateData):
         """
         _call_layers('update', cls, new_model=model, id_attr=cls.id_attr)
 
+    @classmethod
+    def on_update_many(cls, models):
+        """
+        Calls the on_update method on all registered layers for every model
+        before any of them are updated
+
+        Repository implementations MUST call this manually, as layers
+        are an opt-in process
+        :param models: models to be updated
+        :return: None
+        """
+        _call_layers('update_many', cls, new_model=models, id_attr=cls.id_attr)
+
+    @classmethod
+    def on_read_columns(cls, columns):
+        """
+        Calls the on_read_columns method on all registered layers
+        before the columns are read
+
+        Repository implementations MUST call this manually, as layers
+        are an opt-in process
+        :param columns: names of the columns to be read
+        :return: None
+        """
+        _call_layers('read_columns', cls, new_model=columns)
+
     @classmethod
     def on_destroy(cls, model_id):
         """
@@ -0,0 +1,581 @@
+"""
+Bulk writes of DatabaseRepository: many rows per statement, and upserts
+"""
+import datetime
+from abc import abstractmethod
+
+from sqlalchemy import bindparam
+
+from lib.repository import Repository, layers
+from lib.repository.unit_of_work import invalidate
+
+DEFAULT_BULK_CHUNK_SIZE = 500
+SQLITE_MAX_VARIABLES = 999  # lowest bound parameter limit across SQLite versions
+UPSERT_CONFLICTS = ('update', 'skip', 'fail')
+UPSERT_COUNTS = ('inserted', 'updated', 'unchanged')
+
+
+def _memoize(processor):
+    """
+    Caches the results of a bind processor, as imported values often repeat
+    (formatting datetimes is slow on SQLite)
+    :param processor: function or None
+    :return: function or None
+    """
+    if processor is None:
+        return None
+    cache = {}
+
+    def process(value):
+        try:
+            return cache[value]
+        except KeyError:
+            cache[value] = processed = processor(value)
+            return processed
+        except TypeError:  # unhashable
+            return processor(value)
+
+    return process
+
+
+def _stored_value(column, dialect, cast=None):
+    """
+    Used by upsert_values. Converts a value given to the value it is read back
+    as once stored: through the model's field cast (e.g. '2020-01-31' for a Date
+    column), or the column's Python type for other than dates (e.g. '48000.00'
+    for a Float column), then the column type's bind and result processors
+    (e.g. a datetime for a Date column, which are read back as dates)
+    :param column: Column
+    :param dialect: Dialect of the connection
+    :param cast: Optional. The model's field cast of the column
+    :return: function of a value, raising TypeError or ValueError if it cannot be converted
+    """
+    if cast is None:
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        # strings of dates are parsed by the result processor, if at all
+        if python_type is not None and not issubclass(python_type, datetime.date):
+            cast = python_type
+    impl = column.type.dialect_impl(dialect)
+    bind = impl.bind_processor(dialect)
+    result = impl.result_processor(dialect, None)
+
+    def convert(value):
+        if cast is not None:
+            value = cast(value)
+        if bind is not None and not isinstance(value, str):
+            value = bind(value)
+        if result is not None:
+            value = result(value)
+        return value
+
+    return convert
+
+
+def _same_value(convert, given, stored):
+    """
+    Used by upsert_values. Compares a value given with the stored one,
+    converting the given value as it would be stored if needed
+    :param convert: function from _stored_value
+    :param given: value given
+    :param stored: value read
+    :return: bool
+    """
+    if given == stored:
+        return True
+    if given is None or stored is None:
+        return False
+    try:
+        return convert(given) == stored
+    except (TypeError, ValueError):
+        return False
+
+
+def _upsert_insert(table, dialect, on_conflict, id_attr):
+    """
+    Used by upsert_values. The dialect's native INSERT ... ON CONFLICT for
+    on_conflict, if it has one
+    :param table: Table
+    :param dialect: Dialect of the connection
+    :param on_conflict: 'update', 'skip' or 'fail'
+    :param id_attr: name of the ID column
+    :return: Insert, or None for a plain INSERT
+    """
+    if on_conflict == 'fail':
+        return None
+    try:
+        if dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert  # pylint: disable=import-outside-toplevel
+        elif dialect.name == 'sqlite' and dialect.dbapi.sqlite_version_info >= (3, 24):
+            # SQLAlchemy 1.4+
+            from sqlalchemy.dialects.sqlite import insert  # pylint: disable=import-outside-toplevel
+        else:
+            return None
+    except ImportError:
+        return None
+
+    statement = insert(table)
+    if on_conflict == 'skip':
+        return statement.on_conflict_do_nothing(index_elements=[id_attr])
+    return statement.on_conflict_do_update(index_elements=[id_attr], set_={
+        column.name: statement.excluded[column.name] for column in table.columns
+        if column.name not in (id_attr, 'created_at')
+    })
+
+
+def _update_by_id(table, id_attr, fields):
+    """
+    Used by update_many and _update_values. UPDATE of some fields WHERE id =
+    the row's ID. Bound parameters are named after the columns with a leading
+    underscore, as they must not clash with the column names in SET
+    :param table: Table
+    :param id_attr: name of the ID column
+    :param fields: column names to write
+    :return: Update
+    """
+    return table.update() \
+        .where(table.c[id_attr] == bindparam('_' + id_attr)) \
+        .values({column: bindparam('_' + column) for column in fields})
+
+
+def _default_value(column):
+    """
+    Used by _insert_plan. The value of a column default for a whole statement:
+    a scalar default (paid=False...), or a Python function taking no argument,
+    called once
+    :param column: Column
+    :return: value, raises ValueError for a default that needs each row's execution
+        context, or is not a Python value
+    """
+    default = column.default
+    if default is not None and default.is_scalar:
+        return default.arg
+    # SQLAlchemy wraps functions taking no argument to give them the context
+    if default is not None and default.is_callable \
+            and getattr(default.arg, '__wrapped__', None) is not None:
+        return default.arg(None)
+    raise ValueError(f'The default of {column.table.name}.{column.name} cannot be computed '
+                     f'once per statement, give its values')
+
+
+def _insert_plan(table, statement, dialect, columns):
+    """
+    Used by insert_values. Compiles the INSERT once and plans where each bound
+    parameter comes from: a position in the rows, or a constant for the
+    timestamps and the column defaults, see _default_value. Values go
+    through the column type's bind processor
+    :param table: Table
+    :param statement: INSERT construct
+    :param dialect: Dialect of the connection
+    :param columns: list of column names of the rows
+    :return: (SQL string, parameter names, list of (position, processor, constant))
+    """
+    now = datetime.datetime.now()
+    constants = {name: now for name in ('created_at', 'modified_at')
+                 if name in table.c and name not in columns}
+    compiled = statement.compile(dialect=dialect, column_keys=columns + list(constants))
+    # Python-side column defaults are bound like given values
+    for name in compiled.binds:
+        if name not in columns and name not in constants:
+            constants[name] = _default_value(table.c[name])
+
+    names = compiled.positiontup if dialect.positional else list(compiled.binds)
+    plan = []
+    for name in names:
+        processor = _memoize(table.c[name].type.dialect_impl(dialect).bind_processor(dialect))
+        if name in constants:
+            constant = constants[name]
+            plan.append((None, None, processor(constant) if processor else constant))
+        else:
+            plan.append((columns.index(name), processor, None))
+    return str(compiled), names, plan
+
+
+def _split_rows(rows, id_position, compared, stored):
+    """
+    Used by upsert_values. Sorts the rows given into new rows, stored rows
+    with changes and stored rows without
+    :param rows: value tuples
+    :param id_position: position of the ID in the rows
+    :param compared: list of (position, column name, function from _stored_value)
+        compared with the stored values
+    :param stored: dict of ID to the stored values of the compared columns
+    :return: (list of new rows, dict of changed fields to rows, number unchanged)
+    """
+    new = []
+    changes = {}
+    unchanged = 0
+    for row in rows:
+        values = stored.get(row[id_position])
+        if values is None:
+            new.append(row)
+            continue
+        fields = tuple(name for (position, name, convert), value in zip(compared, values)
+                       if not _same_value(convert, row[position], value))
+        if fields:
+            changes.setdefault(fields, []).append(row)
+        else:
+            unchanged += 1
+    return new, changes, unchanged
+
+
+class HasBulkWrites(Repository):
+    """
+    Trait that adds bulk writes to DatabaseRepository
+    """
+    bulk_chunk_size: int = DEFAULT_BULK_CHUNK_SIZE
+
+    @classmethod
+    @abstractmethod
+    def get_table(cls):
+        """
+        See DatabaseRepository.get_table
+        """
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def transaction(cls):
+        """
+        See DatabaseRepository.transaction
+        """
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def _apply_filters(cls, statement, table, filters):
+        """
+        See DatabaseRepository._apply_filters
+        """
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def _read_values(cls, model_ids, columns, chunk_size=None):
+        """
+        See DatabaseRepository._read_values
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def create_many(cls, models, return_models=False, chunk_size=None):
+        """
+        Performs INSERTs for many models inside one transaction
+
+        Layers are called for every model before anything is inserted. Rows are
+        sent with executemany in chunks of chunk_size, grouped by the columns
+        they set so that column defaults still apply to missing fields.
+
+        Models are not re-read after insertion. If return_models is True, the
+        inserted primary keys are set on the models given and they are returned.
+        Models without an ID then need one statement per row (or one multi-row
+        INSERT ... RETURNING per chunk on dialects that support it), still
+        inside the same transaction.
+
+        :param models: list of instances
+        :param return_models: Optional. Return the models with their IDs set
+        :param chunk_size: Optional. Rows per statement (default is bulk_chunk_size)
+        :return: list of models if return_models, otherwise the number of rows inserted
+        """
+        models = list(models)
+        if not models:
+            return [] if return_models else 0
+
+        cls.on_create_many(models)
+
+        chunk_size = chunk_size or cls.bulk_chunk_size
+        table = cls.get_table()
+
+        groups = {}
+        for model in models:
+            row = model.to_dict()
+            groups.setdefault(tuple(sorted(row.keys())), []).append((model, row))
+
+        with cls.transaction() as connection:
+            for columns, group in groups.items():
+                needs_ids = return_models and cls.id_attr not in columns
+                if needs_ids:
+                    cls._insert_returning_ids(connection, table, columns, group, chunk_size)
+                    continue
+                for start in range(0, len(group), chunk_size):
+                    rows = [row for model, row in group[start:start + chunk_size]]
+                    connection.execute(table.insert(), rows)
+
+        if return_models:
+            return models
+        return len(models)
+
+    @classmethod
+    def insert_values(cls, columns, rows, chunk_size=None, statement=None):
+        """
+        Fastest bulk INSERT, for plain rows of values rather than models.
+        Each chunk is one executemany of the compiled statement and values
+        only go through the column types' bind processors. Models are only
+        built when layers are registered, so they see every row like with
+        create_many(). Timestamps are set like create() does
+
+        Example:
+            Receipt.insert_values(['user_id', 'amount'], [('42', 12.5), ('43', 7.0)])
+        :param columns: list of column names
+        :param rows: iterable of value tuples, in the order of columns
+        :param chunk_size: Optional. Rows per executemany (default is bulk_chunk_size)
+        :param statement: Optional. INSERT construct to use (default is table.insert()),
+            like a dialect's insert() with an ON CONFLICT clause
+        :return: number of rows inserted, raises ValueError for a column left out
+            whose default cannot be bound, see _default_value
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        if layers:
+            cls.on_create_many([cls(dict(zip(columns, row))) for row in rows])
+
+        table = cls.get_table()
+        chunk_size = chunk_size or cls.bulk_chunk_size
+        with cls.transaction() as connection:
+            dialect = connection.dialect
+            sql, names, plan = _insert_plan(table, statement if statement is not None
+                                            else table.insert(), dialect, list(columns))
+            for start in range(0, len(rows), chunk_size):
+                parameters = [
+                    [constant if position is None
+                     else processor(row[position]) if processor else row[position]
+                     for position, processor, constant in plan]
+                    for row in rows[start:start + chunk_size]
+                ]
+                if not dialect.positional:
+                    parameters = [dict(zip(names, values)) for values in parameters]
+                connection.execute(sql, parameters)
+
+        return len(rows)
+
+    @classmethod
+    def _insert_returning_ids(cls, connection, table, columns, group,  # pylint: disable=too-many-arguments
+                              chunk_size):
+        """
+        Used by create_many. Inserts rows that have no ID yet and sets the
+        generated IDs on their models
+        :return: None
+        """
+        if connection.dialect.implicit_returning and connection.dialect.supports_multivalues_insert:
+            # keep the multi-row VALUES clause under the bound parameter limit
+            chunk_size = max(1, min(chunk_size, SQLITE_MAX_VARIABLES // max(1, len(columns))))
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                statement = table.insert().values([row for model, row in chunk]) \
+                    .returning(table.c[cls.id_attr])
+                for (model, _), inserted in zip(chunk, connection.execute(statement)):
+                    setattr(model, cls.id_attr, inserted[0])
+            return
+
+        statement = table.insert()
+        for model, row in group:
+            result = connection.execute(statement, row)
+            setattr(model, cls.id_attr, result.inserted_primary_key[0])
+
+    @classmethod
+    def update_many(cls, models, fields=None, chunk_size=None):
+        """
+        Performs UPDATE <values> WHERE id = model_id for many models inside one
+        transaction, sent with executemany in chunks of chunk_size
+
+        Layers are called for every model before anything is updated.
+
+        :param models: list of instances
+        :param fields: Optional. Only these fields are written (default is every field).
+            modified_at is always written for models with timestamps
+        :param chunk_size: Optional. Rows per statement (default is bulk_chunk_size)
+        :return: list of models
+        """
+        models = list(models)
+        if not models:
+            return models
+
+        cls.on_update_many(models)
+
+        chunk_size = chunk_size or cls.bulk_chunk_size
+        table = cls.get_table()
+        now = datetime.datetime.now()
+
+        groups = {}
+        for model in models:
+            if model._has_timestamps:  # pylint: disable=protected-access
+                model.modified_at = now
+            data = model.to_dict()
+            columns = fields if fields is not None else data.keys()
+            columns = [column for column in columns if column != cls.id_attr]
+            if model._has_timestamps and 'modified_at' not in columns:  # pylint: disable=protected-access
+                columns.append('modified_at')
+            row = {'_' + column: data.get(column) for column in columns}
+            row['_' + cls.id_attr] = getattr(model, cls.id_attr)
+            groups.setdefault(tuple(columns), []).append(row)
+
+        with cls.transaction() as connection:
+            for columns, rows in groups.items():
+                statement = _update_by_id(table, cls.id_attr, columns)
+                for start in range(0, len(rows), chunk_size):
+                    connection.execute(statement, rows[start:start + chunk_size])
+
+        for model in models:
+            invalidate(cls, getattr(model, cls.id_attr))
+
+        return models
+
+    @classmethod
+    def upsert_many(cls, models, on_conflict='update', chunk_size=None):
+        """
+        Inserts the models that do not exist yet and handles the others as
+        on_conflict says. Models must have their ID set. See upsert_values
+
+        :param models: list of instances
+        :param on_conflict: Optional. 'update', 'skip' or 'fail'
+        :param chunk_size: Optional. Rows per statement (default is bulk_chunk_size)
+        :return: dict of 'inserted', 'updated' and 'unchanged' counts
+        """
+        groups = {}
+        for model in models:
+            row = model.to_dict()
+            groups.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+
+        counts = dict.fromkeys(UPSERT_COUNTS, 0)
+        with cls.transaction():
+            for columns, rows in groups.items():
+                for key, count in cls.upsert_values(columns, rows, on_conflict,
+                                                    chunk_size).items():
+                    counts[key] += count
+        return counts
+
+    @classmethod
+    def upsert_values(cls, columns, rows, on_conflict='update', chunk_size=None):
+        """
+        Upsert of plain rows of values, inside one transaction. The rows
+        already stored are read first (one query per chunk of IDs), then:
+            new rows are inserted with insert_values()
+            on_conflict='update': only the rows with a changed value are
+                updated, and only their changed columns (and modified_at)
+            on_conflict='skip': stored rows are left as they are
+            on_conflict='fail': nothing is written and ValueError is raised
+                if any row is already stored
+
+        On SQLite (with SQLAlchemy 1.4+) and PostgreSQL, new rows are inserted
+        with INSERT ... ON CONFLICT, so rows inserted by someone else since
+        they were read are updated or skipped too. created_at and modified_at
+        are never compared
+
+        :param columns: list of column names, the ID column included
+        :param rows: iterable of value tuples, in the order of columns
+        :param on_conflict: Optional. 'update', 'skip' or 'fail'
+        :param chunk_size: Optional. Rows per statement (default is bulk_chunk_size)
+        :return: dict of 'inserted', 'updated' and 'unchanged' counts
+        """
+        if on_conflict not in UPSERT_CONFLICTS:
+            raise ValueError(f'on_conflict must be one of {UPSERT_CONFLICTS}')
+        columns = list(columns)
+        if cls.id_attr not in columns:
+            raise ValueError(f'Rows must have their {cls.id_attr} to be upserted')
+        rows = list(rows)
+        counts = dict.fromkeys(UPSERT_COUNTS, 0)
+        if not rows:
+            return counts
+
+        table = cls.get_table()
+        id_position = columns.index(cls.id_attr)
+
+        with cls.transaction() as connection:
+            compared = cls._compared_columns(columns, connection.dialect)
+            stored = cls._read_values(
+                [row[id_position] for row in rows],
+                [column for _, column, _ in compared] if on_conflict == 'update' else [],
+                chunk_size
+            )
+            new, changes, counts['unchanged'] = _split_rows(rows, id_position, compared, stored)
+
+            if on_conflict == 'fail' and len(new) < len(rows):
+                raise ValueError(f'{len(stored)} {cls.__name__} rows already exist, '
+                                 f'{cls.id_attr}s {sorted(stored)[:10]}...')
+
+            counts['inserted'] = cls.insert_values(
+                columns, new, chunk_size,
+                statement=_upsert_insert(table, connection.dialect, on_conflict, cls.id_attr)
+            )
+            for fields, group in changes.items():
+                cls._update_values(connection, columns, fields, group, chunk_size)
+                counts['updated'] += len(group)
+
+        return counts
+
+    @classmethod
+    def _compared_columns(cls, columns, dialect):
+        """
+        Used by upsert_values. The columns of the rows compared with the stored
+        values, all but the ID and the timestamps
+        :param columns: list of column names of the rows
+        :param dialect: Dialect of the connection
+        :return: list of (position, column name, function from _stored_value)
+        """
+        table = cls.get_table()
+        casts = getattr(cls, 'field_casts', {})
+        return [(position, column, _stored_value(table.c[column], dialect, casts.get(column)))
+                for position, column in enumerate(columns)
+                if column not in (cls.id_attr, 'created_at', 'modified_at')]
+
+    @classmethod
+    def _update_values(cls, connection, columns, fields, rows, chunk_size=None):  # pylint: disable=too-many-arguments
+        """
+        Used by upsert_values. UPDATEs some fields of rows of values by ID
+        :param connection: Connection of the transaction
+        :param columns: list of column names of the rows
+        :param fields: column names to write
+        :param rows: value tuples, in the order of columns
+        :param chunk_size: Optional. Rows per statement (default is bulk_chunk_size)
+        :return: None
+        """
+        table = cls.get_table()
+        if layers:
+            cls.on_update_many([cls(dict(zip(columns, row))) for row in rows])
+
+        written = list(fields)
+        now = {}
+        if 'modified_at' in table.c:
+            now['_modified_at'] = datetime.datetime.now()
+            written.append('modified_at')
+        statement = _update_by_id(table, cls.id_attr, written)
+
+        positions = [(f'_{column}', columns.index(column)) for column in (cls.id_attr, *fields)]
+        parameters = [dict(now, **{key: row[position] for key, position in positions})
+                      for row in rows]
+        chunk_size = chunk_size or cls.bulk_chunk_size
+        for start in range(0, len(parameters), chunk_size):
+            connection.execute(statement, parameters[start:start + chunk_size])
+
+        for values in parameters:
+            invalidate(cls, values['_' + cls.id_attr])
+
+    @classmethod
+    def update_where(cls, filters, values):
+        """
+        Performs one set-based UPDATE <values> WHERE <filters> query.
+        Note that Layers are NOT called here, like run_statement.
+        modified_at is set if the table has it and values do not.
+
+        Example:
+            TimeSheet.update_where({'id': [('in', ids)]}, {'paid': True})
+
+        :param filters: dictionary of fields and their filters. See read_by
+        :param values: dictionary of fields and their new values
+        :return: number of rows updated
+        """
+        table = cls.get_table()
+        values = dict(values)
+        if 'modified_at' in table.c and 'modified_at' not in values:
+            values['modified_at'] = datetime.datetime.now()
+
+        statement = cls._apply_filters(table.update(), table, filters).values(**values)
+
+        with cls.transaction() as connection:
+            rowcount = connection.execute(statement).rowcount
+        invalidate(cls)
+
+        return rowcount
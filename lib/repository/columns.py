@@ -0,0 +1,93 @@
+"""
+Column-oriented results of DatabaseRepository.read_columns
+"""
+from array import array
+
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+
+
+class ColumnBatch:
+    """
+    Column-oriented result of read_columns: one column per name selected,
+    aligned by position, and no object per row. Integer columns are
+    array('q') and float columns array('d'), with NaN for NULL. An integer
+    column holding NULLs is a list instead, like columns of every other type
+
+        batch = Employee.read_columns(['id', 'salary'])
+        batch['salary'][0], len(batch), batch.numpy('salary')
+    """
+
+    def __init__(self, names, columns):
+        """
+        :param names: list of column names
+        :param columns: list of arrays or lists, in the order of names
+        """
+        self.names = list(names)
+        self.columns = dict(zip(self.names, columns))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def numpy(self, name):
+        """
+        A column as a NumPy array. Typed arrays are shared, not copied
+        :param name: column name
+        :return: numpy.ndarray
+        """
+        if numpy is None:
+            raise ImportError('numpy is not installed')
+        column = self.columns[name]
+        if isinstance(column, array):
+            return numpy.frombuffer(column, dtype=numpy.int64 if column.typecode == 'q'
+                                    else numpy.float64)
+        return numpy.array(column, dtype=object)
+
+
+def column_array(column, dialect):
+    """
+    Used by read_columns. The empty container a column is read into
+    :param column: Column
+    :param dialect: Dialect of the connection, which picks the type of variants
+    :return: array or list
+    """
+    column_type = column.type
+    if isinstance(column_type, TypeDecorator):  # variants too
+        column_type = column_type.load_dialect_impl(dialect)
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return []
+    if python_type is int:
+        return array('q')
+    if python_type is float:
+        return array('d')
+    return []
+
+
+def extend_column(column, values):
+    """
+    Used by read_columns. Appends a batch of values to a column
+    :param column: array or list from _column_array
+    :param values: tuple of values
+    :return: the column, a list if it had to stop being an integer array
+    """
+    if None in values and isinstance(column, array):
+        if column.typecode == 'd':
+            values = [NAN if value is None else value for value in values]
+        else:
+            column = column.tolist()
+    column.extend(values)
+    return column
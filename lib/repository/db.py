@@ -1,42 +1,195 @@
 """
 Database Repository with helper methods for setup
 """
+import base64
 import datetime
+import json
+import threading
+import time
 from abc import abstractmethod
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine, MetaData, select, Table
+from sqlalchemy import create_engine, MetaData, select, Table, bindparam, and_, or_, \
+    Date, DateTime, inspect
 from sqlalchemy.engine import Engine
-
-from lib.model import database_models
-from lib.repository import Repository
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import QueuePool, SingletonThreadPool, StaticPool
+
+from lib.model import database_models, compact_record_class, cast_columns
+from lib.repository.bulk import HasBulkWrites, DEFAULT_BULK_CHUNK_SIZE, SQLITE_MAX_VARIABLES
+from lib.repository.columns import ColumnBatch, column_array, extend_column
+from lib.repository.unit_of_work import active_unit_of_work, unit_of_work_scope, invalidate
 from lib.repository.validator import HasValidation
 
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 3600  # seconds
+DEFAULT_POOL_TIMEOUT = 30  # seconds
+DEFAULT_STREAM_BATCH_SIZE = 1000
+
+_local = threading.local()
+_tables = {}
+_stats_lock = threading.Lock()
+pool_stats = {
+    'checkouts': 0,
+    'reuses': 0,
+    'wait_time': 0.0,
+}
+
+
+def _engine_options(config):
+    """
+    Builds the pool options given to create_engine from the database config
+
+    Optional config keys:
+        DB_POOL_SIZE: connections kept open in the pool
+        DB_MAX_OVERFLOW: connections allowed beyond DB_POOL_SIZE under load
+        DB_POOL_RECYCLE: seconds before a pooled connection is replaced
+        DB_POOL_TIMEOUT: seconds to wait for a free connection
+        DB_SINGLE_CONNECTION: SQLite only. Shares one connection for the whole process
+        DB_BULK_CHUNK_SIZE: rows per statement for bulk operations (see setup)
+    In-memory SQLite databases are not pooled: every connection would open
+    its own empty database
+    :param config: dict
+    :return: dict of create_engine keyword arguments
+    """
+    url = make_url(config['DB_URL'])
+    is_sqlite = url.get_backend_name() == 'sqlite'
+    options = {}
+
+    if is_sqlite and url.database in (None, '', ':memory:'):
+        options['poolclass'] = SingletonThreadPool
+        return options
+
+    if is_sqlite:
+        # pooled SQLite connections may be handed to a different thread than the one
+        # that opened them. Connections are never used by two threads at once
+        options['connect_args'] = {'check_same_thread': False}
+
+    if is_sqlite and config.get('DB_SINGLE_CONNECTION', False):
+        options['poolclass'] = StaticPool
+        return options
+
+    options['poolclass'] = QueuePool
+    options['pool_size'] = config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+    options['max_overflow'] = config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW)
+    options['pool_recycle'] = config.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE)
+    options['pool_timeout'] = config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT)
+    return options
+
 
 def database_setup(config):
     """
     This statically configures the ORM and database schema
+
+    See _engine_options for the optional connection pool keys
     :param config: dict
     :return: None
     """
-    DatabaseRepository.engine = create_engine(config['DB_URL'], echo=False)
+    DatabaseRepository.engine = create_engine(config['DB_URL'], echo=False,
+                                              **_engine_options(config))
     DatabaseRepository.url = config['DB_URL']
+    DatabaseRepository.config = dict(config)
+    DatabaseRepository.bulk_chunk_size = config.get('DB_BULK_CHUNK_SIZE',
+                                                    DEFAULT_BULK_CHUNK_SIZE)
     DatabaseRepository.metadata = MetaData(DatabaseRepository.engine)
+    with _stats_lock:
+        pool_stats.update(checkouts=0, reuses=0, wait_time=0.0)
 
+    _tables.clear()
     for model in database_models:
-        model.table(metadata=DatabaseRepository.metadata)
+        _tables[model] = model.table(metadata=DatabaseRepository.metadata)
     DatabaseRepository.metadata.create_all()
+    _add_missing_columns(DatabaseRepository.engine, DatabaseRepository.metadata)
+
+
+def _add_missing_columns(engine, metadata):
+    """
+    create_all() only creates missing tables. This brings tables created by
+    an older version up to date with the nullable columns and the indexes
+    added since. Other schema changes are left to a manual migration
+    :param engine: Engine
+    :param metadata: MetaData with every table
+    :return: None
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+
+    for table in metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable or column.primary_key:
+                continue
+            ddl = engine.dialect.ddl_compiler(engine.dialect, CreateColumn(column)).string
+            engine.execute(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}')
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(engine)
+
+
+class Page(list):
+    """
+    One page of models returned by read_by when a limit is given
 
+    next_cursor:
+        Opaque cursor to give read_by as `after` to read the following page.
+        None on the last page
+    """
+
+    def __init__(self, models, next_cursor=None):
+        super().__init__(models)
+        self.next_cursor = next_cursor
+
+
+def _encode_cursor(values):
+    """
+    Packs the sort key values of the last row of a page into an opaque cursor
+    :param values: list of column values
+    :return: str
+    """
+    serialized = [value.isoformat() if isinstance(value, datetime.date) else value
+                  for value in values]
+    return base64.urlsafe_b64encode(json.dumps(serialized).encode()).decode()
 
-class DatabaseRepository(Repository, HasValidation):
+
+def _decode_cursor(cursor, columns):
+    """
+    Unpacks a cursor made by _encode_cursor
+    :param cursor: str
+    :param columns: sqlalchemy Columns the cursor values belong to
+    :return: list of column values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as error:
+        raise ValueError('Invalid page cursor given') from error
+    if len(values) != len(columns):
+        raise ValueError('Page cursor does not match the order_by given')
+
+    decoded = []
+    for column, value in zip(columns, values):
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, Date):
+            value = datetime.date.fromisoformat(value)
+        decoded.append(value)
+    return decoded
+
+
+class DatabaseRepository(HasBulkWrites, HasValidation):
     """
     A SQL implementation of the Repository class
     """
     url: str
+    config: dict
     metadata: MetaData
     engine: Engine
 
     def __init__(self, has_timestamps=True):
-        Repository.__init__(self)
+        HasBulkWrites.__init__(self)
 
         self._has_timestamps = has_timestamps
 
@@ -48,10 +201,130 @@ class DatabaseRepository(Repository, HasValidation):
     @classmethod
     def _open_connection(cls):
         """
-        Used by CRUD methods. This opens a connection with the database
+        Used by CRUD methods. Checks out a connection from the pool, or
+        reuses the connection pinned to this thread by connection_scope()
+        :return: connection instance
+        """
+        pinned = getattr(_local, 'connection', None)
+        if pinned is not None:
+            with _stats_lock:
+                pool_stats['reuses'] += 1
+            return pinned
+
+        start = time.perf_counter()
+        connection = DatabaseRepository.engine.connect()
+        waited = time.perf_counter() - start
+        with _stats_lock:
+            pool_stats['checkouts'] += 1
+            pool_stats['wait_time'] += waited
+        return connection
+
+    @classmethod
+    def _close_connection(cls, connection):
+        """
+        Used by CRUD methods. Returns the connection to the pool unless it is
+        pinned to this thread, in which case connection_scope() releases it
+        :param connection: connection from _open_connection()
+        :return: None
+        """
+        if connection is not getattr(_local, 'connection', None):
+            connection.close()
+
+    @classmethod
+    @contextmanager
+    def connection_scope(cls):
+        """
+        Pins one connection to the current thread so that every CRUD call made
+        inside the scope reuses it. Scopes can be nested.
+
+        Example:
+            with DatabaseRepository.connection_scope():
+                for employee_id in ids:
+                    Employee.read(employee_id)
+        :return: connection instance
+        """
+        pinned = getattr(_local, 'connection', None)
+        if pinned is not None:
+            yield pinned
+            return
+
+        connection = cls._open_connection()
+        _local.connection = connection
+        try:
+            yield connection
+        finally:
+            _local.connection = None
+            connection.close()
+
+    @classmethod
+    @contextmanager
+    def transaction(cls):
+        """
+        Runs every CRUD call inside the scope on one pinned connection and in
+        one transaction, committed when the scope exits and rolled back if an
+        exception is raised. Nested scopes join the outermost transaction.
+
+        Example:
+            with DatabaseRepository.transaction():
+                Receipt.create_many(receipts)
+                Employee.update(employee)
         :return: connection instance
         """
-        return DatabaseRepository.engine.connect()
+        if getattr(_local, 'transaction', None) is not None:
+            yield _local.connection
+            return
+
+        with cls.connection_scope() as connection:
+            _local.transaction = connection.begin()
+            try:
+                yield connection
+                _local.transaction.commit()
+            except BaseException:
+                _local.transaction.rollback()
+                raise
+            finally:
+                _local.transaction = None
+
+    @classmethod
+    @contextmanager
+    def unit_of_work(cls):
+        """
+        Opt-in scope where repeated read() calls for the same model are answered
+        from memory. Rows are forgotten when update(), update_many() or destroy()
+        touch them. update_where() forgets the whole model class and
+        run_statement() forgets everything. Also pins one connection, like
+        connection_scope(). Nested scopes join the outermost one.
+
+        Example:
+            with DatabaseRepository.unit_of_work() as unit:
+                employee = Employee.read(employee_id)
+                Employee.read(employee_id)  # no query
+            print(unit.stats())
+        :return: UnitOfWork
+        """
+        unit = active_unit_of_work()
+        if unit is not None:
+            yield unit
+            return
+
+        with cls.connection_scope(), unit_of_work_scope() as unit:
+            yield unit
+
+    @staticmethod
+    def get_pool_stats():
+        """
+        Connection pool counters since database_setup() was called
+
+        checkouts: connections taken from the pool
+        reuses: CRUD calls served by a connection pinned with connection_scope()
+        wait_time: total seconds spent waiting on the pool
+        :return: dict
+        """
+        with _stats_lock:
+            stats = dict(pool_stats)
+        pool = DatabaseRepository.engine.pool
+        stats['checked_out'] = pool.checkedout() if hasattr(pool, 'checkedout') else None
+        return stats
 
     @abstractmethod
     def to_dict(self):
@@ -74,6 +347,20 @@ class DatabaseRepository(Repository, HasValidation):
         """
         raise NotImplementedError
 
+    @classmethod
+    def get_table(cls) -> Table:
+        """
+        The Table object for the Repository, built once and cached per class.
+        Registered models are compiled by database_setup()
+
+        :return: sqlalchemy Table object
+        """
+        table = _tables.get(cls)
+        if table is None:
+            table = cls.table(DatabaseRepository.metadata)
+            _tables[cls] = table
+        return table
+
     @classmethod
     def create(cls, model):
         """
@@ -86,139 +373,460 @@ class DatabaseRepository(Repository, HasValidation):
         cls.on_create(model)
 
         connection = cls._open_connection()
-        statement = cls.table(DatabaseRepository.metadata).insert().values(**model.to_dict())
+        statement = cls.get_table().insert().values(**model.to_dict())
         result = connection.execute(statement)
         setattr(model, cls.id_attr, result.inserted_primary_key[0])
-        connection.close()
+        cls._close_connection(connection)
 
         inserted = cls.read(getattr(model, cls.id_attr))
 
         return inserted
 
     @classmethod
-    def read(cls, model_id):
+    def read(cls, model_id, columns=None):  # pylint: disable=arguments-differ
         """
         Performs a SELECT * WHERE id = model_id given
 
         :param model_id: ID of model
-        :param id_attr: Optional. Name of ID attribute (default is 'id'). Matches to column
+        :param columns: Optional. Only select these columns. See _select
         :return: model
         """
+        unit = active_unit_of_work() if columns is None else None
+        remembered = unit.get(cls, model_id) if unit is not None else None
+        if remembered is not None:
+            keys, row = remembered
+            model = cls._hydrate_rows(keys, [row])[0]
+            cls.after_read(model)
+            return model
+
         connection = cls._open_connection()
-        table = cls.table(DatabaseRepository.metadata)
-        statement = select([table]).where(table.c[cls.id_attr] == model_id)
+        table = cls.get_table()
+        statement = cls._select(table, columns).where(table.c[cls.id_attr] == model_id)
         result = connection.execute(statement)
+        keys, rows = result.keys(), result.fetchall()
+        models = cls._hydrate_rows(keys, rows, columns)
+        cls._close_connection(connection)
 
-        # Converts the result proxy into a dictionary and an array of values only
-        # data, values = {}, []
-        data = {}
-        rowcount = 0
-        for rowproxy in result:
-            # rowproxy.items() returns an array like [(key0, value0), (key1, value1)]
-            for column, value in rowproxy.items():
-                # build up the dictionary
-                data = {**data, **{column: value}}
-            # values.append(data)
-            rowcount += 1
-
-        if rowcount > 0:
-            model = cls(data)  # pylint: disable=too-many-function-args
-        else:
-            model = None
+        if unit is not None and rows:
+            unit.remember(cls, model_id, keys, rows[0])
 
-        connection.close()
+        model = models[0] if models else None
 
         cls.after_read(model)
 
         return model
 
     @classmethod
-    def read_by(cls, filters=None, as_dict=False):  # pylint: disable=arguments-differ
+    def read_by(cls, filters=None, as_dict=False, *,  # pylint: disable=arguments-differ,too-many-arguments
+                order_by=None, limit=None, after=None, columns=None, compact=False):
         """
         Performs a SELECT * WHERE filterKey (=) filterValue given
 
+        Giving a limit pages through the results with a keyset on order_by and
+        the ID, which stays cheap however deep the page is. The order_by column
+        should be indexed and not nullable.
+            page = Employee.read_by({}, order_by='last_name', limit=100)
+            next_page = Employee.read_by({}, order_by='last_name', limit=100,
+                                         after=page.next_cursor)
+
         :param filters: dictionary of fields and their filters
             Example:
                 filters = {
                     'first_name': 'john_doe',                   # first_name = 'john_doe'
                     'age': [('>', 5)],                          # age > 5
-                    'number_of_corn': [('>=', 5), ('<', 10)]    # 5 >= number_of_corn < 10
+                    'number_of_corn': [('>=', 5), ('<', 10)],   # 5 >= number_of_corn < 10
+                    'id': [('in', [1, 2, 3])]                   # id IN (1, 2, 3)
                 }
         :param as_dict: Return results as dictionary with the `id_attr` as the key
+        :param order_by: Optional. Column to sort by. Prefix with '-' to sort descending
+        :param limit: Optional. Maximum number of rows. Returns a Page
+        :param after: Optional. next_cursor of the previous Page
+        :param columns: Optional. Only select these columns, plus the order_by
+            column when paging. See _select
+        :param compact: Optional. Return read-only CompactRecords. See _hydrate_records
         :return: all rows that fit filter criteria
         """
-        if filters is None:
-            return cls.read_all()
+        paging = order_by is not None or limit is not None or after is not None
+        if filters is None and not paging:
+            return cls.read_all(as_dict=as_dict, columns=columns, compact=compact)
+        if as_dict and limit is not None:
+            raise ValueError('as_dict cannot be combined with a limit')
+
+        if paging and columns is not None:
+            # the cursor is read from the keyset columns of the last row
+            sort_column = (order_by or cls.id_attr).lstrip('-')
+            if sort_column not in columns:
+                columns = list(columns) + [sort_column]
+
+        table = cls.get_table()
+        statement = cls._apply_filters(cls._select(table, columns), table, filters or {})
+        key_columns = []
+        if paging:
+            statement, key_columns = cls._apply_keyset(statement, table, order_by, after)
+        if limit is not None:
+            return cls._read_page(statement, limit, key_columns, columns=columns, compact=compact)
+
+        keys, rows = cls._fetch(statement)
+        return cls._after_read_rows(cls._hydrate_rows(keys, rows, columns, compact=compact),
+                                    as_dict)
+
+    @classmethod
+    def _read_page(cls, statement, limit, key_columns, *, columns=None, compact=False):
+        """
+        Used by read_by given a limit. Reads one row more than the limit, which
+        tells whether there is a next page
+        :param statement: select statement, ordered by key_columns
+        :param limit: maximum number of rows
+        :param key_columns: columns the cursor is made from, see _apply_keyset
+        :param columns: Optional. Columns selected. See _select
+        :param compact: Optional. Return read-only CompactRecords. See _hydrate_records
+        :return: Page
+        """
+        keys, rows = cls._fetch(statement.limit(limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor([rows[-1][column.name] for column in key_columns])
+
+        models = Page(cls._hydrate_rows(keys, rows, columns, compact=compact),
+                      next_cursor=next_cursor)
+        cls.after_read_many(models_read=models)
+        return models
 
+    @classmethod
+    def _fetch(cls, statement):
+        """
+        Used by read methods. Runs a select statement and fetches every row
+        :param statement: select statement
+        :return: (column names, rows)
+        """
         connection = cls._open_connection()
-        table = cls.table(DatabaseRepository.metadata)
-        statement = select([table])
+        result = connection.execute(statement)
+        keys, rows = result.keys(), result.fetchall()
+        cls._close_connection(connection)
+        return keys, rows
 
-        for column, value in filters.items():
-            if isinstance(value, list):
-                statement = DatabaseRepository._convert_comparator(statement, table, column, value)
-            else:
-                statement = statement.where(table.c[column] == value)
+    @classmethod
+    def read_all(cls, as_dict=False, columns=None, compact=False):  # pylint: disable=arguments-differ
+        """
+        Performs a SELECT * on the entire table
 
+        :param as_dict: Return results as dictionary with the `id_attr` as the key
+        :param columns: Optional. Only select these columns. See _select
+        :param compact: Optional. Return read-only CompactRecords. See _hydrate_records
+        :return: all rows
+        """
+        connection = cls._open_connection()
+        statement = cls._select(cls.get_table(), columns)
         result = connection.execute(statement)
-        model_dicts = result.fetchall() if result is not None else None
-        connection.close()
+        keys, rows = result.keys(), result.fetchall()
+        cls._close_connection(connection)
+
+        models = cls._hydrate_rows(keys, rows, columns, skip_root=True, compact=compact)
+        return cls._after_read_rows(models, as_dict)
+
+    @classmethod
+    def read_many(cls, model_ids, as_dict=True,  # pylint: disable=too-many-arguments
+                  chunk_size=None, columns=None, compact=False):
+        """
+        Performs SELECT * WHERE id IN (...) queries for many IDs at once.
+        IDs are deduplicated and split into chunks of chunk_size, so N lookups
+        take ceil(N / chunk_size) queries. Layers are called once per chunk.
+
+        IDs that do not exist are left out of the result.
+
+        :param model_ids: iterable of IDs, of the same type as the ID column
+        :param as_dict: Return results as dictionary with the `id_attr` as the key
+        :param chunk_size: Optional. IDs per query (default is bulk_chunk_size)
+        :param columns: Optional. Only select these columns. See _select
+        :param compact: Optional. Return read-only CompactRecords. See _hydrate_records
+        :return: models in the order their IDs were first given
+        """
+        model_ids = list(dict.fromkeys(model_id for model_id in model_ids if model_id is not None))
+        chunk_size = min(chunk_size or DatabaseRepository.bulk_chunk_size, SQLITE_MAX_VARIABLES)
+
+        table = cls.get_table()
+        found = {}
+        connection = cls._open_connection()
+        try:
+            for start in range(0, len(model_ids), chunk_size):
+                chunk = model_ids[start:start + chunk_size]
+                statement = cls._select(table, columns).where(table.c[cls.id_attr].in_(chunk))
+                result = connection.execute(statement)
+                models = cls._hydrate_rows(result.keys(), result.fetchall(), columns,
+                                           compact=compact)
+                found.update(cls._after_read_rows(models, as_dict=True))
+        finally:
+            cls._close_connection(connection)
 
         if as_dict:
-            models = {}
-            if model_dicts is not None:
-                for raw in model_dicts:
-                    models[raw[cls.id_attr]] = cls(dict(raw))  # pylint: disable=too-many-function-args
+            return {model_id: found[model_id] for model_id in model_ids if model_id in found}
+        return [found[model_id] for model_id in model_ids if model_id in found]
 
-            cls.after_read_many(models_read=models.values())
+    @classmethod
+    def existing_ids(cls, model_ids, chunk_size=None):
+        """
+        Which of the IDs given exist, like read_many(columns=[]) without
+        building models. Layers are NOT called, as no model is read
+
+        :param model_ids: iterable of IDs, of the same type as the ID column
+        :param chunk_size: Optional. IDs per query (default is bulk_chunk_size)
+        :return: set of IDs
+        """
+        return set(cls._read_values(model_ids, [], chunk_size))
+
+    @classmethod
+    def _read_values(cls, model_ids, columns, chunk_size=None):
+        """
+        Reads the raw values of some columns for many IDs, one query per chunk
+        :param model_ids: iterable of IDs
+        :param columns: list of column names
+        :param chunk_size: Optional. IDs per query (default is bulk_chunk_size)
+        :return: dict of ID to tuple of values, in the order of columns
+        """
+        model_ids = list(set(model_ids))
+        chunk_size = min(chunk_size or DatabaseRepository.bulk_chunk_size, SQLITE_MAX_VARIABLES)
+
+        table = cls.get_table()
+        id_column = table.c[cls.id_attr]
+        statement = select([id_column] + [table.c[column] for column in columns]) \
+            .where(id_column.in_(bindparam('ids', expanding=True)))
+        found = {}
+        connection = cls._open_connection()
+        try:
+            for start in range(0, len(model_ids), chunk_size):
+                result = connection.execute(statement, ids=model_ids[start:start + chunk_size])
+                found.update((row[0], tuple(row[1:])) for row in result)
+        finally:
+            cls._close_connection(connection)
+        return found
+
+    @classmethod
+    def _after_read_rows(cls, models, as_dict=False):
+        """
+        Used by read methods. Keys the models by ID if asked, then calls the layers
 
+        :param models: list of models
+        :param as_dict: Return results as dictionary with the `id_attr` as the key
+        :return: list or dict of models
+        """
+        if as_dict:
+            models = {getattr(model, cls.id_attr): model for model in models}
+            cls.after_read_many(models_read=models.values())
             return models
-        models = []
-        if model_dicts is not None:
-            for raw in model_dicts:
-                models.append(cls(dict(raw)))  # pylint: disable=too-many-function-args
 
         cls.after_read_many(models_read=models)
-
         return models
 
     @classmethod
-    def read_all(cls, as_dict=False):  # pylint: disable=arguments-differ
+    def read_columns(cls, columns, filters=None, order_by=None,
+                     batch_size=DEFAULT_STREAM_BATCH_SIZE):
         """
-        Performs a SELECT * on the entire table
+        Reads a few columns of many rows into a ColumnBatch, without building
+        a model per row. Field casts are NOT applied, values are the ones read
+        from the database. Layers check the column names before anything is
+        read, see Repository.on_read_columns
+
+            batch = Employee.read_columns(['id', 'salary'], {'classification_id': 2})
+
+        :param columns: list of column names
+        :param filters: Optional. dictionary of fields and their filters. See read_by
+        :param order_by: Optional. Column to sort by, prefix with '-' to sort descending
+            (default is the ID)
+        :param batch_size: Optional. Rows fetched at a time
+        :return: ColumnBatch
+        """
+        cls.on_read_columns(columns)
+        table = cls.get_table()
+        statement = select([table.c[name] for name in columns])
+        if filters is not None:
+            statement = cls._apply_filters(statement, table, filters)
+        order_by = order_by or cls.id_attr
+        if order_by.startswith('-'):
+            statement = statement.order_by(table.c[order_by[1:]].desc())
+        else:
+            statement = statement.order_by(table.c[order_by])
 
-        :param as_dict: Return results as dictionary with the `id_attr` as the key
-        :return: all rows
+        connection = cls._open_connection()
+        try:
+            arrays = [column_array(table.c[name], connection.dialect) for name in columns]
+            result = connection.execution_options(stream_results=True).execute(statement)
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                arrays = [extend_column(column, values)
+                          for column, values in zip(arrays, zip(*rows))]
+        finally:
+            cls._close_connection(connection)
+
+        return ColumnBatch(columns, arrays)
+
+    @classmethod
+    def iter_by(cls, filters=None, batch_size=DEFAULT_STREAM_BATCH_SIZE, columns=None,
+                compact=False):
+        """
+        Streams a SELECT * WHERE filterKey (=) filterValue given.
+        Rows are fetched batch_size at a time with a server-side cursor where the
+        driver supports one, and layers are called once per batch.
+
+        The connection is held until the generator is exhausted or closed. On
+        SQLite, write through the same connection while iterating by wrapping the
+        loop in connection_scope(), otherwise the open read can block the write.
+
+        :param filters: dictionary of fields and their filters. See read_by
+        :param batch_size: Optional. Rows fetched and hydrated at a time
+        :param columns: Optional. Only select these columns. See _select
+        :param compact: Optional. Yield read-only CompactRecords. See _hydrate_records
+        :return: generator of models
+        """
+        table = cls.get_table()
+        statement = cls._select(table, columns)
+        if filters is not None:
+            statement = cls._apply_filters(statement, table, filters)
+
+        return cls._iter_statement(statement, batch_size, columns, compact=compact)
+
+    @classmethod
+    def iter_all(cls, batch_size=DEFAULT_STREAM_BATCH_SIZE, columns=None, compact=False):
+        """
+        Streams a SELECT * on the entire table. See iter_by
+
+        :param batch_size: Optional. Rows fetched and hydrated at a time
+        :param columns: Optional. Only select these columns. See _select
+        :param compact: Optional. Yield read-only CompactRecords. See _hydrate_records
+        :return: generator of models
+        """
+        statement = cls._select(cls.get_table(), columns)
+        return cls._iter_statement(statement, batch_size, columns, skip_root=True,
+                                   compact=compact)
+
+    @classmethod
+    def _iter_statement(cls, statement, batch_size, columns=None,  # pylint: disable=too-many-arguments
+                        skip_root=False, compact=False):
+        """
+        Used by iter_by and iter_all. Hydrates and yields models one batch at a time
+
+        :param statement: select statement
+        :param batch_size: rows fetched and hydrated at a time
+        :param columns: columns selected, or None for every column
+        :param skip_root: skips the row with the ID of -1, like read_all
+        :param compact: Optional. Yield read-only CompactRecords
+        :return: generator of models
         """
         connection = cls._open_connection()
-        table = cls.table(DatabaseRepository.metadata)
-        statement = select([table])
-        result = connection.execute(statement)
-        model_dicts = result.fetchall() if result is not None else None
-        connection.close()
+        try:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            keys = result.keys()
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                models = cls._hydrate_rows(keys, rows, columns, skip_root=skip_root,
+                                           compact=compact)
+                cls.after_read_many(models_read=models)
+
+                yield from models
+        finally:
+            cls._close_connection(connection)
 
-        if as_dict:
-            models = {}
-            if model_dicts is not None:
-                for raw in model_dicts:
-                    if raw[0] == -1:
-                        continue
-                    models[raw[cls.id_attr]] = cls(dict(raw))  # pylint: disable=too-many-function-args
+    @classmethod
+    def _select(cls, table, columns=None):
+        """
+        Used by read methods. Builds a SELECT * or, if columns are given, a SELECT
+        of only those columns. The ID is always selected, as the first column.
 
-            cls.after_read_many(models_read=models.values())
+        Projected reads return partial models: only the selected fields are set
+        and field casts only apply to them. Saving a partial model with update()
+        only writes the fields it has.
 
-            return models
-        models = []
-        if model_dicts is not None:
-            for raw in model_dicts:
-                if raw[0] == -1:
-                    continue
-                models.append(cls(dict(raw)))  # pylint: disable=too-many-function-args
+        :param table: sqlalchemy Table object
+        :param columns: list of column names or None
+        :return: select statement
+        """
+        if columns is None:
+            return select([table])
+        names = [cls.id_attr] + [column for column in columns if column != cls.id_attr]
+        return select([table.c[name] for name in names])
 
-        cls.after_read_many(models_read=models)
+    @classmethod
+    def _hydrate_rows(cls, keys, rows, columns=None,  # pylint: disable=too-many-arguments
+                      skip_root=False, compact=False):
+        """
+        Used by read methods. Maps result rows into models.
+
+        Each row is zipped against the column list of the result, computed once
+        per query, rather than going through the row proxy's mapping interface.
+        Field casts are applied on first access, from the cast plan compiled
+        once per model class. See DynamicModel.cast_fields
+
+        :param keys: column names of the result, in order
+        :param rows: result rows
+        :param columns: columns selected, or None for every column
+        :param skip_root: skips the row with the ID of -1, like read_all
+        :param compact: Optional. Build CompactRecords instead. See _hydrate_records
+        :return: list of models
+        """
+        keys = tuple(keys)
+        if compact:
+            return cls._hydrate_records(keys, rows, skip_root)
+        # the constructor stamps timestamps on models missing them
+        fabricated = [] if columns is None else \
+            [field for field in ('created_at', 'modified_at') if field not in keys]
 
+        models = []
+        for row in rows:
+            if skip_root and row[0] == -1:
+                continue
+            model = cls(dict(zip(keys, row)))  # pylint: disable=too-many-function-args
+            for field in fabricated:
+                delattr(model, field)
+            models.append(model)
+        cls.after_hydrate(models)
         return models
 
+    @classmethod
+    def after_hydrate(cls, models):
+        """
+        Called with the models built by every read, before the layers run.
+        Not called for CompactRecords. Override to load relationships in bulk
+        :param models: list of models
+        :return: None
+        """
+
+    @classmethod
+    def _hydrate_records(cls, keys, rows, skip_root=False):
+        """
+        Used by read methods given compact=True. Maps result rows into the
+        model's CompactRecord class: one slot per column instead of a data dict,
+        no validation and no relationships. Field casts still apply, a column at
+        a time (see cast_columns), so fields read the same as the model's. For
+        read-only bulk paths
+
+        :param keys: column names of the result, in order
+        :param rows: result rows
+        :param skip_root: skips the row with the ID of -1, like read_all
+        :return: list of CompactRecords
+        """
+        record_cls = compact_record_class(cls, [column.name for column in cls.get_table().columns])
+        setters = [getattr(record_cls, key).__set__ for key in keys]
+        new = object.__new__
+
+        if skip_root:
+            rows = [row for row in rows if row[0] != -1]
+        if not rows:
+            return []
+        columns = cast_columns(cls, keys, [list(column) for column in zip(*rows)])
+
+        records = []
+        for values in zip(*columns):
+            record = new(record_cls)
+            for setter, value in zip(setters, values):
+                setter(record, value)
+            records.append(record)
+        return records
+
     @classmethod
     def update(cls, model):
         """
@@ -234,10 +842,11 @@ class DatabaseRepository(Repository, HasValidation):
             model.modified_at = datetime.datetime.now()
 
         connection = cls._open_connection()
-        table = cls.table(DatabaseRepository.metadata)
+        table = cls.get_table()
         statement = table.update().where(table.c[cls.id_attr] == model.id).values(**model.to_dict())
         connection.execute(statement)
-        connection.close()
+        cls._close_connection(connection)
+        invalidate(cls, model.id)
         return model
 
     @classmethod
@@ -252,10 +861,11 @@ class DatabaseRepository(Repository, HasValidation):
         cls.on_destroy(model_id)
 
         connection = cls._open_connection()
-        table = cls.table(DatabaseRepository.metadata)
+        table = cls.get_table()
         statement = table.delete().where(table.c[cls.id_attr] == model_id)
         connection.execute(statement)
-        connection.close()
+        cls._close_connection(connection)
+        invalidate(cls, model_id)
 
     @classmethod
     def run_statement(cls, statement):
@@ -264,17 +874,72 @@ class DatabaseRepository(Repository, HasValidation):
         NOT updated here nor are Layers called
 
         :param statement: can be created like the following:
-            table = self.table(DatabaseRepository.metadata)
+            table = cls.get_table()
             statement = table.delete().where(...)
-        :return: all rows of result set
+        :return: all rows of result set, or None for statements returning no rows
         """
         connection = cls._open_connection()
         result = connection.execute(statement)
-        results = result.fetchall() if result is not None else None
-        connection.close()
+        results = result.fetchall() if result is not None and result.returns_rows else None
+        cls._close_connection(connection)
+        invalidate()
 
         return results
 
+    @classmethod
+    def _apply_filters(cls, statement, table, filters):
+        """
+        Adds the WHERE clauses for a filters dictionary. See read_by
+
+        :param statement: select, update or delete statement to build upon
+        :param table: sqlalchemy Table object
+        :param filters: dictionary of fields and their filters
+        :return: statement built
+        """
+        for column, value in filters.items():
+            if isinstance(value, list):
+                statement = DatabaseRepository._convert_comparator(statement, table, column, value)
+            else:
+                statement = statement.where(table.c[column] == value)
+        return statement
+
+    @classmethod
+    def _apply_keyset(cls, statement, table, order_by, after):
+        """
+        Adds the ORDER BY and keyset WHERE clauses used to page through read_by
+
+        :param statement: select statement to build upon
+        :param table: sqlalchemy Table object
+        :param order_by: column name, prefixed with '-' for descending. Defaults to the ID
+        :param after: cursor of the last row already read, or None
+        :return: statement built and the columns the cursor is made from
+        """
+        order_by = order_by or cls.id_attr
+        descending = order_by.startswith('-')
+        column = table.c[order_by.lstrip('-')]
+        id_column = table.c[cls.id_attr]
+
+        key_columns = [column] if column is id_column else [column, id_column]
+
+        if after is not None:
+            values = _decode_cursor(after, key_columns)
+            if descending:
+                condition = column < values[0]
+                if len(key_columns) > 1:
+                    condition = or_(condition, and_(column == values[0], id_column < values[1]))
+            else:
+                condition = column > values[0]
+                if len(key_columns) > 1:
+                    condition = or_(condition, and_(column == values[0], id_column > values[1]))
+            statement = statement.where(condition)
+
+        if descending:
+            statement = statement.order_by(*[key.desc() for key in key_columns])
+        else:
+            statement = statement.order_by(*key_columns)
+
+        return statement, key_columns
+
     @classmethod
     def _convert_comparator(cls, statement, table, field, expressions):
         """
@@ -303,6 +968,8 @@ class DatabaseRepository(Repository, HasValidation):
                 statement = statement.where(table.c[field] < expression[1])
             elif expression[0] == 'like':
                 statement = statement.where(table.c[field].like(expression[1]))
+            elif expression[0] == 'in':
+                statement = statement.where(table.c[field].in_(expression[1]))
             else:
                 raise NotImplementedError('Invalid comparator given in DB Expression')
         return statement
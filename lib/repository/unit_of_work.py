@@ -0,0 +1,103 @@
+"""
+Identity map of DatabaseRepository.unit_of_work(), kept per thread
+"""
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class UnitOfWork:
+    """
+    Identity map of the rows read inside DatabaseRepository.unit_of_work(),
+    keyed by (model class, ID)
+
+    Rows are kept rather than models: every read() gets a fresh model built
+    from the remembered row, so changing a model never changes what a later
+    read() inside the scope returns. Layers still run on every read.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, repo_cls, model_id):
+        """
+        Looks up a remembered row and counts the hit or miss
+        :param repo_cls: Repository class type
+        :param model_id: ID of model
+        :return: (keys, row) or None
+        """
+        entry = self.rows.get((repo_cls, model_id))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def remember(self, repo_cls, model_id, keys, row):
+        """
+        Remembers a row read from the database
+        :return: None
+        """
+        self.rows[(repo_cls, model_id)] = (tuple(keys), tuple(row))
+
+    def invalidate(self, repo_cls=None, model_id=None):
+        """
+        Forgets one row, every row of a model class, or everything
+        :param repo_cls: Optional. Repository class type
+        :param model_id: Optional. ID of model
+        :return: None
+        """
+        if repo_cls is None:
+            self.rows.clear()
+        elif model_id is None:
+            for key in [key for key in self.rows if key[0] is repo_cls]:
+                del self.rows[key]
+        else:
+            self.rows.pop((repo_cls, model_id), None)
+
+    def stats(self):
+        """
+        :return: dict of hits, misses and rows remembered
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.rows),
+        }
+
+
+
+def active_unit_of_work():
+    """
+    :return: the UnitOfWork active on this thread, or None
+    """
+    return getattr(_local, 'unit_of_work', None)
+
+
+@contextmanager
+def unit_of_work_scope():
+    """
+    Used by DatabaseRepository.unit_of_work(). Makes a new UnitOfWork
+    active on this thread until the scope exits
+    :return: UnitOfWork
+    """
+    _local.unit_of_work = UnitOfWork()
+    try:
+        yield _local.unit_of_work
+    finally:
+        _local.unit_of_work = None
+
+
+def invalidate(repo_cls=None, model_id=None):
+    """
+    Used by write methods. Forgets rows in the unit of work active on this thread
+    :param repo_cls: Optional. Repository class type
+    :param model_id: Optional. ID of model
+    :return: None
+    """
+    unit = active_unit_of_work()
+    if unit is not None:
+        unit.invalidate(repo_cls, model_id)
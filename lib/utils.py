@@ -16,9 +16,48 @@ def sha_hash(string) -> str:
     return str(sha256((string + HASH_SALT).encode()).hexdigest())
 
 
+def converter(*result_types):
+    """
+    Decorator declaring the types a field cast function returns. Cast plans
+    skip the values that already have one of them, like the dates and floats
+    the database driver returns. See DynamicModel.cast_plan
+    :param result_types: types
+    :return: decorator
+    """
+    def decorate(function):
+        function.result_types = result_types
+        return function
+    return decorate
+
+
+@converter(int)
+def int_converter(value):
+    """
+    Helper for model field caster. Converts to int
+    :param value: int or str
+    :return: int
+    """
+    return int(value)
+
+
+@converter(float, type(None))
+def float_or_none(value):
+    """
+    Helper for model field caster. Converts to float, keeping None (or 'None') as None
+    :param value: float, str or None
+    :return: float or None
+    """
+    if value is None or value == 'None':
+        return None
+    return float(value)
+
+
+@converter(datetime.date, datetime.datetime, type(None))
 def date_converter(date_thing):
     """
     Helper for model field caster. Converts a date of some string or date to datetime.date
+
+    ISO dates (2020-12-31) take a fast path, then 12/31/20 and 2020-1-31 are tried
     :param date_thing: date of type unknown
     :return: Date object
     """
@@ -27,8 +66,13 @@ def date_converter(date_thing):
     if isinstance(date_thing, datetime.date):
         return date_thing
     if isinstance(date_thing, str):
+        if len(date_thing) == 10 and date_thing[4] == '-':
+            try:
+                return datetime.date.fromisoformat(date_thing)
+            except ValueError:
+                pass
         try:
             return datetime.datetime.strptime(date_thing, '%m/%d/%y').date()
-        except:
+        except ValueError:
             return datetime.datetime.strptime(date_thing, '%Y-%m-%d').date()
     raise ValueError(f'Invalid date "{date_thing}" given')
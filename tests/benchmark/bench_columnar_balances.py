@@ -0,0 +1,73 @@
+"""
+Benchmark of the columnar balance computation against the per-object one,
+reported in balances per second.
+
+Both paths are timed with their reads included (Employee models streamed
+by Payroll.balances() against typed columns read by balance_columns()), then
+on data already in memory. The columnar pass uses numpy when installed.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_columnar_balances [employees]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from lib.model.employee import Employee
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.payroll import Payroll
+from lib.payroll import columnar
+from lib.repository.db import database_setup
+from tests.fixtures import employee
+
+
+def _report(label, seconds, count):
+    print(f'{label:<36} {count / seconds:12,.0f} balances/s')
+
+
+if __name__ == '__main__':
+    EMPLOYEES = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        end = datetime.datetime(2020, 5, 1, 17)
+        Employee.create_many([employee(i) for i in range(1, EMPLOYEES + 1)])
+        TimeSheet.create_many([TimeSheet({
+            'user_id': i,
+            'datetime_begin': end - datetime.timedelta(hours=8),
+            'datetime_end': end,
+        }) for i in range(1, EMPLOYEES + 1)])
+        Receipt.create_many([Receipt({
+            'user_id': i,
+            'amount': 100.0,
+        }) for i in range(1, EMPLOYEES + 1)])
+
+        payroll = Payroll()
+        payroll.load_totals()
+        print(f'numpy: {"yes" if columnar.numpy is not None else "no (array fallback)"}')
+
+        start = time.perf_counter()
+        employees = [employee for employee, _ in payroll.balances()]
+        _report('per-object, reads included', time.perf_counter() - start, EMPLOYEES)
+
+        start = time.perf_counter()
+        columns, _ = payroll.balance_columns()
+        _report('columnar, reads included', time.perf_counter() - start, EMPLOYEES)
+
+        start = time.perf_counter()
+        for employee in employees:
+            payroll.balance(employee)
+        _report('per-object, in memory', time.perf_counter() - start, EMPLOYEES)
+
+        start = time.perf_counter()
+        columnar.compute_balances(columns, payroll.hours, payroll.receipts)
+        _report('columnar, in memory', time.perf_counter() - start, EMPLOYEES)
+    finally:
+        os.remove(db_path)
@@ -0,0 +1,51 @@
+"""
+Benchmark of compact records against models, reported in bytes held per
+Employee (measured with tracemalloc) and Employees read per second.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_compact_records [rows]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lib.model.employee import Employee
+from lib.repository.db import database_setup
+from tests.fixtures import employee
+
+
+def _measure(label, read, count):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    employees = read()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(employees) == count
+    print(f'{label:<24} {held / count:10,.0f} bytes/employee {count / seconds:12,.0f} reads/s')
+    return held
+
+
+if __name__ == '__main__':
+    ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        Employee.create_many([employee(i) for i in range(1, ROWS + 1)])
+        Employee.read_all(compact=True)  # generates the record class outside the measure
+
+        models = _measure('read_all()', Employee.read_all, ROWS)
+        records = _measure('read_all(compact=True)',
+                           lambda: Employee.read_all(compact=True), ROWS)
+        print(f'{models / records:.1f}x less memory held')
+    finally:
+        os.remove(db_path)
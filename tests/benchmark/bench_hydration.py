@@ -0,0 +1,70 @@
+"""
+Benchmark of Employee row hydration, reported in hydrations per second.
+
+Rows are fetched once, then mapped into models repeatedly so only the
+row-to-model cost is measured. The old per-column dictionary merge used by
+read() is timed alongside for comparison.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_hydration [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select
+
+from lib.model.employee import Employee
+from lib.repository.db import database_setup, DatabaseRepository
+from tests.fixtures import employee
+
+
+def _merge_per_column(fetched):
+    """
+    The hydration read() used to do: a new dictionary for every column
+    """
+    models = []
+    for rowproxy in fetched:
+        data = {}
+        for column, value in rowproxy.items():
+            data = {**data, **{column: value}}
+        models.append(Employee(data))
+    return models
+
+
+def _report(label, seconds, count):
+    print(f'{label:<28} {count / seconds:12,.0f} hydrations/s')
+
+
+if __name__ == '__main__':
+    ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        Employee.create_many([employee(i, classification_id=1, paymethod_id=1,
+                                       notes='Lorem ipsum dolor sit amet')
+                              for i in range(1, ROWS + 1)])
+
+        connection = DatabaseRepository.engine.connect()
+        result = connection.execute(select([Employee.get_table()]))
+        keys, rows = result.keys(), result.fetchall()
+        connection.close()
+
+        start = time.perf_counter()
+        _merge_per_column(rows)
+        _report('per-column dict merge', time.perf_counter() - start, ROWS)
+
+        start = time.perf_counter()
+        Employee._hydrate_rows(keys, rows)  # pylint: disable=protected-access
+        _report('_hydrate_rows', time.perf_counter() - start, ROWS)
+
+        start = time.perf_counter()
+        Employee.read_all()
+        _report('read_all (query included)', time.perf_counter() - start, ROWS)
+    finally:
+        os.remove(db_path)
@@ -0,0 +1,77 @@
+"""
+Benchmark of the CSV import pipeline, reported in rows per second.
+
+Generates an employees file, then receipts and timesheets files with
+VALUES_PER_LINE values per employee, and times every import into a fresh
+SQLite database.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_import [employees]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from lib.cli.import_csv import import_employees, import_receipts, import_timesheets
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.repository.db import database_setup, DatabaseRepository
+
+VALUES_PER_LINE = 10
+
+
+def _write(path, lines):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.writelines(line + '\n' for line in lines)
+
+
+def _time(label, method, path, count):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        method(path)
+    seconds = time.perf_counter() - start
+    print(f'{label:<12} {count:>9,} rows {seconds:8.2f}s {count / seconds:12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    EMPLOYEES = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_setup({
+            'DB_URL': f'sqlite+pysqlite:///{os.path.join(directory, "bench.db")}'
+        })
+
+        rng = random.Random(0)
+        employees_path = os.path.join(directory, 'employees.csv')
+        _write(employees_path, [
+            'ID,Name,Address,City,State,Zip,Classification,PayMethod,Salary,Hourly,Commission,'
+            'Route,Account'
+        ] + [
+            f'{employee_id},John Doe,1 Main St.,Orem,UT,84058,{employee_id % 3 + 1},'
+            f'{employee_id % 2 + 1},48000.00,20.00,10,30417353-K,465794-3611'
+            for employee_id in range(1, EMPLOYEES + 1)
+        ])
+        receipts_path = os.path.join(directory, 'receipts.csv')
+        _write(receipts_path, [
+            ','.join([str(employee_id)] + [f'{rng.uniform(10, 300):.2f}'
+                                           for _ in range(VALUES_PER_LINE)])
+            for employee_id in range(1, EMPLOYEES + 1)
+        ])
+        timesheets_path = os.path.join(directory, 'timesheets.csv')
+        _write(timesheets_path, [
+            ','.join([str(employee_id)] + [f'{rng.uniform(4, 9):.1f}'
+                                           for _ in range(VALUES_PER_LINE)])
+            for employee_id in range(1, EMPLOYEES + 1)
+        ])
+
+        _time('employees', import_employees, employees_path, EMPLOYEES)
+        _time('receipts', import_receipts, receipts_path, EMPLOYEES * VALUES_PER_LINE)
+        _time('timesheets', import_timesheets, timesheets_path, EMPLOYEES * VALUES_PER_LINE)
+
+        assert len(Receipt.read_all()) == EMPLOYEES * VALUES_PER_LINE
+        assert len(TimeSheet.read_all()) == EMPLOYEES * VALUES_PER_LINE
+        DatabaseRepository.engine.dispose()
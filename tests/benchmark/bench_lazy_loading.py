@@ -0,0 +1,56 @@
+"""
+Benchmark of lazy field casting and relationship loading against eager
+loading, reported in Employees read per second for a list view reading
+names only, and for payroll reading every field.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_lazy_loading [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from lib.model import eager_loading
+from lib.model.employee import Employee
+from lib.repository.db import database_setup
+from tests.fixtures import employee
+
+
+def _names():
+    return [employee.get_name() for employee in Employee.read_all()]
+
+
+def _everything():
+    return [(employee.to_dict(), employee.classification, employee.payment_method)
+            for employee in Employee.read_all()]
+
+
+def _time(label, read, count, eager=False):
+    start = time.perf_counter()
+    if eager:
+        with eager_loading():
+            read()
+    else:
+        read()
+    seconds = time.perf_counter() - start
+    print(f'{label:<24} {count / seconds:12,.0f} reads/s')
+
+
+if __name__ == '__main__':
+    ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        Employee.create_many([employee(i) for i in range(1, ROWS + 1)])
+
+        _time('names, lazy', _names, ROWS)
+        _time('names, eager', _names, ROWS, eager=True)
+        _time('every field, lazy', _everything, ROWS)
+        _time('every field, eager', _everything, ROWS, eager=True)
+    finally:
+        os.remove(db_path)
@@ -0,0 +1,88 @@
+"""
+Benchmark of run_payroll --workers, reported in employees per second.
+
+A synthetic database is filled with employees of every classification,
+one timesheet and one receipt each. The same payroll is run with 1, 2, 4
+and 8 worker processes, reopening the pay period between runs, and every
+run must pay the same total.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_payroll_workers [employees]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select, func
+
+from lib.model.employee import Employee
+from lib.model.pay_period import PayPeriod
+from lib.model.payroll_run import PayrollRun, PayrollEntry
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.payroll.ledger import start_run, pay_employees, write_output
+from lib.repository.db import database_setup
+from tests.fixtures import employee
+
+
+def _reset():
+    """
+    Forgets the previous run so the next one pays everyone again: its
+    timesheets and receipts go back to the open pay period, unpaid
+    """
+    for repo_cls in (TimeSheet, Receipt):
+        table = repo_cls.get_table()
+        repo_cls.run_statement(table.update().values(paid=False, pay_period_id=None))
+    for repo_cls in (PayrollEntry, PayrollRun, PayPeriod):
+        repo_cls.run_statement(repo_cls.get_table().delete())
+
+
+def _total_paid():
+    table = PayrollEntry.get_table()
+    return PayrollEntry.run_statement(select([func.sum(table.c.balance)]))[0][0]
+
+
+if __name__ == '__main__':
+    EMPLOYEES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    directory = tempfile.mkdtemp()
+    db_path = os.path.join(directory, 'bench.db')
+    output_path = os.path.join(directory, 'payroll.txt')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        end = datetime.datetime(2020, 5, 1, 17)
+        Employee.create_many([employee(i) for i in range(1, EMPLOYEES + 1)])
+        TimeSheet.create_many([TimeSheet({
+            'user_id': i,
+            'datetime_begin': end - datetime.timedelta(hours=8),
+            'datetime_end': end,
+        }) for i in range(1, EMPLOYEES + 1)])
+        Receipt.create_many([Receipt({
+            'user_id': i,
+            'amount': 100.0,
+        }) for i in range(1, EMPLOYEES + 1)])
+
+        totals = []
+        for workers in (1, 2, 4, 8):
+            _reset()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+            start = time.perf_counter()
+            run = start_run(output_path)
+            pay_employees(run, workers=workers)
+            write_output(run)
+            seconds = time.perf_counter() - start
+            totals.append(_total_paid())
+            print(f'{workers} worker(s) {seconds:8.2f}s {EMPLOYEES / seconds:12,.0f} employees/s '
+                  f'{totals[-1]:16,.2f} paid')
+        assert len(set(totals)) == 1, 'every run must pay for the same work'
+    finally:
+        os.remove(db_path)
+        if os.path.exists(output_path):
+            os.remove(output_path)
@@ -0,0 +1,41 @@
+"""
+Microbenchmark of the per-call cost of resolving a model's Table object.
+
+Compares building a fresh Table with Employee.table() (what every CRUD call
+used to do) against the cached DatabaseRepository.get_table(), then times
+Employee.read() end to end.
+
+Run from the repository root:
+    python -m tests.benchmark.bench_table_cache
+"""
+import os
+import tempfile
+import timeit
+
+from lib.model.employee import Employee
+from lib.repository.db import database_setup, DatabaseRepository
+
+ITERATIONS = 2000
+
+
+def _per_call_us(statement, number=ITERATIONS):
+    return timeit.timeit(statement, number=number) / number * 1e6
+
+
+if __name__ == '__main__':
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    database_setup({
+        'DB_URL': f'sqlite+pysqlite:///{db_path}'
+    })
+
+    try:
+        uncached = _per_call_us(lambda: Employee.table(DatabaseRepository.metadata))
+        cached = _per_call_us(Employee.get_table)
+        print(f'Employee.table() per call:     {uncached:10.2f} us')
+        print(f'Employee.get_table() per call: {cached:10.2f} us')
+        print(f'Saved per CRUD call:           {uncached - cached:10.2f} us')
+
+        read = _per_call_us(lambda: Employee.read(1), number=ITERATIONS // 4)
+        print(f'Employee.read() per call:      {read:10.2f} us')
+    finally:
+        os.remove(db_path)
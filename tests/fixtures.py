@@ -0,0 +1,39 @@
+"""
+Rows shared by the unit tests and the benchmarks
+"""
+import datetime
+
+from lib.model.employee import Employee
+
+
+def employee(employee_id, **fields):
+    """
+    An Employee with every required field set. Classifications and payment
+    methods rotate with the ID
+    :param employee_id: int
+    :param fields: Optional. Fields to set instead of the defaults
+    :return: Employee
+    """
+    return Employee({
+        'id': employee_id,
+        'password': '',
+        'role': 'Viewer',
+        'first_name': 'John',
+        'last_name': 'Doe',
+        'user_group_id': 0,
+        'start_date': datetime.date(2020, 1, 1),
+        'date_of_birth': datetime.date(1990, 1, 1),
+        'sex': 'Not Set',
+        'address_line1': '1 Main St.',
+        'city': 'Orem',
+        'state': 'UT',
+        'zipcode': '84058',
+        'classification_id': employee_id % 3 + 1,
+        'paymethod_id': employee_id % 2 + 1,
+        'salary': 48000.0,
+        'hourly_rate': 20.0,
+        'commission_rate': 10.0,
+        'bank_routing': '123456780',
+        'bank_account': '4657943611',
+        **fields,
+    })
@@ -0,0 +1,113 @@
+"""
+Property test: the columnar balances equal the per-object ones
+
+Random employees of every classification are given random totals, and
+compute_balances() must return exactly what Payroll.balance() does, with
+numpy and with the array fallback. Employees missing a salary or rate
+their classification uses must fail both.
+
+Run from the repository root:
+    python -m unittest tests.unit.test_columnar_balances
+"""
+import datetime
+import random
+import unittest
+
+from lib.model.employee import Employee, Hourly, Salaried, Commissioned
+from lib.payroll import Payroll
+from lib.payroll import columnar
+
+EXAMPLES = 200
+EMPLOYEES = 50
+
+
+def _amount(rng):
+    return rng.choice([0.0, round(rng.uniform(0, 200000), 2), rng.uniform(0, 1e6)])
+
+
+def _random_employee(rng, employee_id):
+    classification_id = rng.choice([Hourly.get_id(), Salaried.get_id(), Commissioned.get_id()])
+    employee = Employee({
+        'id': employee_id,
+        'role': 'Viewer',
+        'first_name': 'John',
+        'last_name': 'Doe',
+        'start_date': datetime.date(2020, 1, 1),
+        'classification_id': classification_id,
+        'paymethod_id': rng.choice([1, 2]),
+        'salary': _amount(rng),
+        'hourly_rate': _amount(rng) / 1000,
+        'commission_rate': rng.uniform(0, 100),
+    })
+    # fields a classification does not use may be missing, and rarely one it uses
+    for field in ('salary', 'hourly_rate', 'commission_rate'):
+        if rng.random() < (0.01 if _uses(classification_id, field) else 0.1):
+            employee.data[field] = None
+    return employee
+
+
+def _uses(classification_id, field):
+    if classification_id == Hourly.get_id():
+        return field == 'hourly_rate'
+    if classification_id == Salaried.get_id():
+        return field == 'salary'
+    return field in ('salary', 'commission_rate')
+
+
+def _columns(employees):
+    columns = columnar.EmployeeColumns()
+    for employee in employees:
+        columns.append((employee.id, employee.classification_id, employee.paymethod_id,
+                        employee.salary, employee.hourly_rate, employee.commission_rate))
+    return columns
+
+
+class ColumnarBalancesTest(unittest.TestCase):
+    """
+    compute_balances() against Payroll.balance()
+    """
+
+    def check(self, numpy_module):
+        """Compares both paths on random employees, with numpy_module as columnar.numpy"""
+        rng = random.Random(42)
+        saved, columnar.numpy = columnar.numpy, numpy_module
+        failures = 0
+        try:
+            for _ in range(EXAMPLES):
+                employees = [_random_employee(rng, employee_id)
+                             for employee_id in range(1, rng.randint(1, EMPLOYEES) + 1)]
+                payroll = Payroll(timesheet_watermark=0, receipt_watermark=0)
+                payroll.hours = {employee.id: rng.uniform(0, 200)
+                                 for employee in employees if rng.random() < 0.7}
+                payroll.receipts = {employee.id: _amount(rng)
+                                    for employee in employees if rng.random() < 0.7}
+
+                try:
+                    expected = [payroll.balance(employee) for employee in employees]
+                except TypeError:
+                    # a NULL salary or rate fails both paths, rather than paying NaN
+                    with self.assertRaises(ValueError):
+                        columnar.compute_balances(_columns(employees),
+                                                  payroll.hours, payroll.receipts)
+                    failures += 1
+                    continue
+                actual = columnar.compute_balances(_columns(employees),
+                                                   payroll.hours, payroll.receipts)
+
+                self.assertEqual(expected, actual)
+            self.assertGreater(failures, 0)
+        finally:
+            columnar.numpy = saved
+
+    def test_array_fallback(self):
+        """Balances computed without numpy"""
+        self.check(None)
+
+    @unittest.skipIf(columnar.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        """Balances computed with numpy"""
+        self.check(columnar.numpy)
+
+
+if __name__ == '__main__':
+    unittest.main()
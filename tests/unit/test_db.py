@@ -0,0 +1,129 @@
+"""
+Tests of DatabaseRepository reads, upserts and connection handling, on in-memory SQLite
+
+Run from the repository root:
+    python -m unittest tests.unit.test_db
+"""
+import datetime
+import unittest
+
+from sqlalchemy.pool import SingletonThreadPool
+
+from lib.layer.security import SecurityLayer, SecurityException
+from lib.model.change_request import ChangeRequest
+from lib.model.employee import Employee
+from lib.repository import layers
+from lib.repository.db import database_setup, DatabaseRepository
+from tests.fixtures import employee
+
+
+class InMemoryDatabaseTest(unittest.TestCase):
+    """
+    In-memory databases keep the schema across nested connections
+    """
+
+    def setUp(self):
+        database_setup({
+            'DB_URL': 'sqlite://'
+        })
+
+    def test_not_pooled(self):
+        """In-memory databases use one connection per thread"""
+        self.assertIsInstance(DatabaseRepository.engine.pool, SingletonThreadPool)
+
+    def test_nested_connections_share_the_schema(self):
+        """A connection opened inside another sees the tables"""
+        ChangeRequest.create(ChangeRequest({
+            'author_user_id': 1,
+            'table_name': 'employee',
+            'row_id': 1,
+            'changes': '[]',
+            'reason': 'test',
+        }))
+        self.assertEqual(len(ChangeRequest.read_all()), 1)
+
+
+class ReadByTest(unittest.TestCase):
+    """
+    Paging through projected reads
+    """
+
+    def setUp(self):
+        database_setup({
+            'DB_URL': 'sqlite://'
+        })
+        Employee.create_many([employee(employee_id, last_name=last_name)
+                              for employee_id, last_name in enumerate('DCBAEDCBAE', start=1)])
+
+    def test_pages_ordered_outside_the_projection(self):
+        """Pages ordered by a column left out of the projection cover every row once"""
+        employee_ids = []
+        page = Employee.read_by({}, order_by='-last_name', limit=3, columns=['first_name'])
+        while True:
+            employee_ids += [employee.id for employee in page]
+            if page.next_cursor is None:
+                break
+            page = Employee.read_by({}, order_by='-last_name', limit=3, columns=['first_name'],
+                                    after=page.next_cursor)
+        self.assertEqual(employee_ids, [10, 5, 6, 1, 7, 2, 8, 3, 9, 4])
+
+    def test_compact_reads_matching_nothing(self):
+        """Compact reads matching nothing return no records"""
+        self.assertEqual(Employee.read_by({'last_name': 'Nobody'}, compact=True), [])
+        self.assertEqual(list(Employee.iter_by({'last_name': 'Nobody'}, compact=True)), [])
+        self.assertEqual(len(Employee.read_by({'last_name': 'A'}, compact=True)), 2)
+
+
+class UpsertTest(unittest.TestCase):
+    """
+    Upserts only count and write the rows that changed
+    """
+
+    def setUp(self):
+        database_setup({
+            'DB_URL': 'sqlite://'
+        })
+        Employee.create(employee(1))
+
+    def test_unchanged_dates(self):
+        """Dates given as stored, as strings or as datetimes are not changes"""
+        self.assertEqual(Employee.upsert_many([employee(1)])['unchanged'], 1)
+        columns = ['id', 'start_date', 'date_of_birth', 'last_name']
+        for row in ((1, '2020-01-01', '1990-01-01', 'Doe'),
+                    (1, datetime.datetime(2020, 1, 1), datetime.datetime(1990, 1, 1), 'Doe')):
+            self.assertEqual(Employee.upsert_values(columns, [row])['unchanged'], 1)
+
+        counts = Employee.upsert_values(columns, [(1, datetime.date(2020, 1, 2),
+                                                   datetime.date(1990, 1, 1), 'Doe')])
+        self.assertEqual(counts['updated'], 1)
+        self.assertEqual(Employee.read(1).start_date, datetime.date(2020, 1, 2))
+
+
+class ReadColumnsTest(unittest.TestCase):
+    """
+    Columnar reads go through the layers like model reads
+    """
+
+    def setUp(self):
+        database_setup({
+            'DB_URL': 'sqlite://'
+        })
+        Employee.create_many([employee(employee_id) for employee_id in range(1, 4)])
+        reporter = employee(4)
+        reporter.role = 'Reporter'
+        self.layer = SecurityLayer(reporter)
+
+    def tearDown(self):
+        layers.remove(self.layer)
+
+    def test_cant_read_columns_are_refused(self):
+        """Columns the role cannot read are refused, others are read"""
+        with self.assertRaises(SecurityException):
+            Employee.read_columns(['id', 'salary'])
+        with self.assertRaises(SecurityException):
+            Employee.read_columns(['bank_routing'], {'id': 1})
+        self.assertEqual(list(Employee.read_columns(['id', 'last_name'])['id']), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
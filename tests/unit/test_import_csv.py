@@ -0,0 +1,111 @@
+"""
+Tests of the employee import: --on-conflict, and rejects with --workers
+
+Run from the repository root:
+    python -m unittest tests.unit.test_import_csv
+"""
+import contextlib
+import csv
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from lib.cli.import_csv import import_employees
+from lib.model.employee import Employee
+from lib.repository.db import database_setup
+
+HEADER = 'ID,Name,Address,City,State,Zip,Classification,PayMethod,Salary,Hourly,Commission,' \
+         'Route,Account'
+EMPLOYEES = 60
+BAD_STATE_IDS = (7, 23, 24, 51)  # rejected for their state
+
+
+def _line(employee_id, salary='48000.00', state='UT'):
+    return f'{employee_id},John Doe,1 Main St.,Orem,{state},84058,{employee_id % 3 + 1},' \
+           f'{employee_id % 2 + 1},{salary},20.00,10,30417353-K,465794-3611'
+
+
+class ImportEmployeesTest(unittest.TestCase):
+    """
+    Counts of each --on-conflict, and line numbers of the rejects
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        database_setup({
+            'DB_URL': f'sqlite+pysqlite:///{os.path.join(self.directory, "import.db")}'
+        })
+        self.filepath = os.path.join(self.directory, 'employees.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, lines):
+        with open(self.filepath, 'w', encoding='utf-8') as file:
+            file.write('\n'.join([HEADER] + lines) + '\n')
+
+    def _import(self, *options, range_size=512):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            import_employees(self.filepath, *options, range_size=range_size)
+        return output.getvalue()
+
+    def test_on_conflict(self):
+        """Each --on-conflict counts new, updated and unchanged employees"""
+        self._write([_line(employee_id) for employee_id in range(1, EMPLOYEES + 1)])
+        self.assertIn(f': {EMPLOYEES} new, 0 updated, 0 unchanged', self._import())
+        output = self._import()
+        self.assertIn(': 0 new, 0 updated, 0 unchanged', output)
+        self.assertIn(f'{EMPLOYEES} rows were rejected', output)
+
+        # every 10th employee gets a raise, and one more is hired
+        self._write([_line(employee_id, '50000.00' if employee_id % 10 == 0 else '48000.00')
+                     for employee_id in range(1, EMPLOYEES + 2)])
+        self.assertIn(f': 1 new, 0 updated, {EMPLOYEES} unchanged',
+                      self._import('--on-conflict', 'skip'))
+        self.assertEqual(Employee.read(10).salary, 48000.0)
+
+        self.assertIn(f': 0 new, 6 updated, {EMPLOYEES - 5} unchanged',
+                      self._import('--on-conflict', 'update'))
+        self.assertEqual(Employee.read(10).salary, 50000.0)
+        self.assertEqual(Employee.read(11).salary, 48000.0)
+        self.assertEqual(len(Employee.read_all()), EMPLOYEES + 1)
+
+    def test_fail_rejects_stored_employees(self):
+        """The default --on-conflict rejects stored and repeated employees, and goes on"""
+        self._write([_line(employee_id) for employee_id in range(1, 4)])
+        self._import()
+
+        # employee 2 is already stored, employee 5 is given twice
+        self._write([_line(4), _line(2), _line(5), _line(5)])
+        self.assertEqual(self._rejected_lines(2, '--commit-every', '1'),
+                         [(3, 'id', 2), (5, 'id', 5)])
+        self.assertEqual(sorted(employee.id for employee in Employee.read_all()),
+                         [1, 2, 3, 4, 5])
+
+    def _rejected_lines(self, count, *options):
+        rejects = os.path.join(self.directory, 'rejects.csv')
+        output = self._import('--rejects', rejects, *options)
+        self.assertIn(f'{count} rows were rejected', output)
+        with open(rejects, newline='', encoding='utf-8') as file:
+            return [(int(row['line']), row['field'], int(row['row']))
+                    for row in csv.DictReader(file)]
+
+    def test_reject_line_numbers_with_workers(self):
+        """Rejects keep their line numbers in the file, with or without workers"""
+        self._write([_line(employee_id, state='XX' if employee_id in BAD_STATE_IDS else 'UT')
+                     for employee_id in range(1, EMPLOYEES + 1)])
+        # the header is line 1, so employee N is on line N + 1
+        expected = [(employee_id + 1, 'state', employee_id) for employee_id in BAD_STATE_IDS]
+
+        self.assertEqual(self._rejected_lines(len(BAD_STATE_IDS), '--workers', '3'), expected)
+        self.assertEqual(len(Employee.read_all()), EMPLOYEES - len(BAD_STATE_IDS))
+
+        Employee.run_statement(Employee.get_table().delete())
+        self.assertEqual(self._rejected_lines(len(BAD_STATE_IDS)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,272 @@
+"""
+Tests of the payroll engine and resumable runs, on a temporary SQLite database
+
+Run from the repository root:
+    python -m unittest tests.unit.test_payroll
+"""
+import collections
+import csv
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from lib.model.employee import Employee, Hourly, Salaried, Commissioned, DirectMethod, \
+    MailMethod
+from lib.model.payroll_run import PayrollRun, PayrollEntry, RUNNING, WRITING, COMPLETE, \
+    ABANDONED
+from lib.model.receipt import Receipt
+from lib.model.timesheet import TimeSheet
+from lib.payroll import Payroll, preview_payroll
+from lib.payroll.ledger import PayrollException, check_output, start_run, pay_employees, \
+    write_output, find_unfinished_run, abandon_run
+from lib.payroll.writers import routing_number, CsvWriter
+from lib.repository.db import database_setup
+from tests.fixtures import employee
+
+FORMATS = {DirectMethod.name: 'csv', MailMethod.name: 'csv'}
+
+
+class PayrollTestCase(unittest.TestCase):
+    """
+    Gives every test a new database file
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        database_setup({
+            'DB_URL': f'sqlite+pysqlite:///{os.path.join(self.directory, "payroll.db")}'
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class LoadTotalsTest(PayrollTestCase):
+    """
+    Hours totalled in SQL match TimeSheet.to_hours() to the second
+    """
+
+    def test_hours_are_exact(self):
+        """Whole minutes total the same hours in SQL and in Python"""
+        rng = random.Random(0)
+        Employee.create(employee(1, classification_id=Hourly.get_id()))
+        begin = datetime.datetime(2020, 1, 1, 8, 0)
+        timesheets = []
+        for day in range(700):
+            datetime_begin = begin + datetime.timedelta(days=day, minutes=rng.randrange(60))
+            timesheets.append(TimeSheet({
+                'user_id': 1,
+                'datetime_begin': datetime_begin,
+                'datetime_end': datetime_begin + datetime.timedelta(minutes=rng.randrange(600)),
+            }))
+        TimeSheet.create_many(timesheets)
+
+        payroll = Payroll()
+        payroll.load_totals()
+        seconds = sum((timesheet.datetime_end - timesheet.datetime_begin).total_seconds()
+                      for timesheet in timesheets)
+        self.assertEqual(payroll.hours[1], seconds / 3600)
+
+    def test_fractions_of_seconds(self):
+        """SQLite totals whole seconds, to_hours() keeps the microseconds"""
+        Employee.create(employee(1, classification_id=Hourly.get_id()))
+        timesheet = TimeSheet({
+            'user_id': 1,
+            'datetime_begin': datetime.datetime(2020, 1, 1, 8, 0, 0, 250000),
+            'datetime_end': datetime.datetime(2020, 1, 1, 9, 0, 0, 750000),
+        })
+        TimeSheet.create(timesheet)
+
+        payroll = Payroll()
+        payroll.load_totals()
+        self.assertEqual(payroll.hours[1], 1.0)
+        self.assertEqual(timesheet.to_hours(), 3600.5 / 3600)
+
+
+class OutputCheckTest(PayrollTestCase):
+    """
+    Formats and employees are checked before a run is recorded
+    """
+
+    def test_routing_number(self):
+        """Routing numbers are cleaned up and their check digit verified"""
+        self.assertEqual(routing_number('123456780'), '123456780')
+        self.assertEqual(routing_number('1234-5678 0'), '123456780')
+        self.assertIsNone(routing_number('123456789'))  # check digit
+        self.assertIsNone(routing_number('30417353-K'))
+        self.assertIsNone(routing_number('7117844-7'))
+        self.assertIsNone(routing_number(None))
+
+    def test_nacha_only_writes_direct_deposits(self):
+        """No run is recorded with a format its method cannot be written in"""
+        with self.assertRaises(PayrollException):
+            start_run(os.path.join(self.directory, 'payroll.txt'), {MailMethod.name: 'nacha'})
+        self.assertEqual(PayrollRun.read_all(), [])
+
+    def test_bad_routing_reported_up_front(self):
+        """Employees with a bad routing number are listed before any run"""
+        employees = [employee(employee_id, paymethod_id=DirectMethod.get_id())
+                     for employee_id in range(1, 4)]
+        employees[1].bank_routing = '30417353-K'
+        Employee.create_many(employees)
+
+        with self.assertRaises(PayrollException) as context:
+            check_output({DirectMethod.name: 'nacha', MailMethod.name: 'text'})
+        self.assertIn('Employee#2', str(context.exception))
+        self.assertNotIn('Employee#1', str(context.exception))
+        check_output({DirectMethod.name: 'text', MailMethod.name: 'text'})
+
+
+def _fail_on_call(method, call):
+    """
+    Wraps a method to raise on its call-th call, after calling through before
+    :param method: function
+    :param call: number of the call raising, from 1
+    :return: function
+    """
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == call:
+            raise RuntimeError('crash')
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+class ResumeTest(PayrollTestCase):
+    """
+    A run failing in a batch or while writing is resumed, and pays each employee once
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.output = os.path.join(self.directory, 'payroll.csv')
+        classifications = [Hourly.get_id(), Salaried.get_id(), Commissioned.get_id()]
+        Employee.create_many([
+            employee(employee_id, classification_id=classifications[employee_id % 3])
+            for employee_id in range(1, 24)
+        ])
+        begin = datetime.datetime(2020, 1, 1, 8, 0)
+        TimeSheet.create_many([TimeSheet({
+            'user_id': employee_id,
+            'datetime_begin': begin,
+            'datetime_end': begin + datetime.timedelta(hours=8),
+        }) for employee_id in range(1, 24) for _ in range(2)])
+        Receipt.create_many([Receipt({
+            'user_id': employee_id,
+            'amount': 100.0,
+        }) for employee_id in range(1, 24)])
+        self.expected = {employee_id: round(balance, 2)
+                         for employee_id, balance in preview_payroll().items() if balance > 0}
+
+    def _output(self):
+        with open(self.output, newline='', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+        paid = collections.Counter(int(row['employee_id']) for row in rows)
+        self.assertEqual(max(paid.values()), 1)
+        return {int(row['employee_id']): float(row['amount']) for row in rows}
+
+    def _assert_paid_once(self, run):
+        self.assertEqual(PayrollRun.read(run.id).status, COMPLETE)
+        entries = PayrollEntry.read_by({'run_id': run.id})
+        paid = collections.Counter(entry.employee_id for entry in entries)
+        self.assertEqual(set(paid), set(range(1, 24)))
+        self.assertEqual(max(paid.values()), 1)
+        self.assertEqual(self._output(), self.expected)
+        # hours and receipts are not paid again, only salaries are due
+        for employee_id, balance in preview_payroll().items():
+            self.assertEqual(round(balance, 2), 0.0 if employee_id % 3 == 0 else 2000.0)
+
+    def test_resume_after_failed_batch_and_write(self):
+        """A run resumed after a failed batch, then a failed write, pays everyone once"""
+        run = start_run(self.output, FORMATS)
+        with mock.patch.object(Payroll, 'settle', _fail_on_call(Payroll.settle, 2)):
+            with self.assertRaises(RuntimeError):
+                pay_employees(run, batch_size=5)
+        run = find_unfinished_run()
+        self.assertEqual((run.status, run.checkpoint_employee_id), (RUNNING, 5))
+        self.assertEqual(len(PayrollEntry.read_by({'run_id': run.id})), 5)
+
+        pay_employees(run, batch_size=5)
+        with mock.patch.object(CsvWriter, 'format', _fail_on_call(CsvWriter.format, 12)):
+            with self.assertRaises(RuntimeError):
+                write_output(run, batch_size=5)
+        run = find_unfinished_run()
+        self.assertEqual(run.status, WRITING)
+
+        write_output(run, batch_size=5)
+        self.assertIsNone(find_unfinished_run())
+        self._assert_paid_once(run)
+
+    def _abandon(self):
+        run = find_unfinished_run()
+        abandon_run(run)
+        self.assertEqual(PayrollRun.read(run.id).status, ABANDONED)
+        self.assertEqual(PayrollEntry.read_by({'run_id': run.id}), [])
+        self.assertIsNone(find_unfinished_run())
+        self.assertEqual({employee_id: round(balance, 2) for employee_id, balance
+                          in preview_payroll().items() if balance > 0}, self.expected)
+
+    def test_abandon_and_start_over(self):
+        """Abandoned runs leave balances as they were, for a new run to pay"""
+        run = start_run(self.output, {DirectMethod.name: 'text', MailMethod.name: 'text'})
+        with mock.patch.object(Payroll, 'settle', _fail_on_call(Payroll.settle, 3)):
+            with self.assertRaises(RuntimeError):
+                pay_employees(run, batch_size=5)
+        self._abandon()
+
+        run = start_run(self.output, {DirectMethod.name: 'text', MailMethod.name: 'text'})
+        pay_employees(run, batch_size=5)
+        self._abandon()
+
+        run = start_run(self.output, FORMATS)
+        pay_employees(run, batch_size=5)
+        write_output(run, batch_size=5)
+        self._assert_paid_once(run)
+
+    def test_abandon_keeps_rows_paid_outside_the_run(self):
+        """Rows paid before the run, left in the open period, stay paid when it is abandoned"""
+        # as Employee.get_balance settles them
+        TimeSheet.update_where({'user_id': 3}, {'paid': True})
+        before = preview_payroll()
+        self.assertEqual(before[3], 0.0)
+
+        run = start_run(self.output, {DirectMethod.name: 'text', MailMethod.name: 'text'})
+        with mock.patch.object(Payroll, 'settle', _fail_on_call(Payroll.settle, 3)):
+            with self.assertRaises(RuntimeError):
+                pay_employees(run, batch_size=5)
+        abandon_run(find_unfinished_run())
+
+        self.assertEqual(preview_payroll(), before)
+        timesheets = TimeSheet.read_by({'user_id': 3})
+        self.assertTrue(all(timesheet.paid for timesheet in timesheets))
+        self.assertEqual({timesheet.pay_period_id for timesheet in timesheets}, {None})
+
+    def test_abandon_leaves_files_it_did_not_write(self):
+        """Abandoning before the output is written keeps the previous run's files whole"""
+        formats = {DirectMethod.name: 'nacha', MailMethod.name: 'text'}
+        run = start_run(self.output, formats)
+        pay_employees(run, batch_size=5)
+        write_output(run, batch_size=5)
+        written = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.db'):
+                with open(os.path.join(self.directory, filename), 'rb') as file:
+                    written[filename] = file.read()
+
+        run = start_run(self.output, formats)
+        pay_employees(run, batch_size=5)
+        abandon_run(run)
+        for filename, content in written.items():
+            with open(os.path.join(self.directory, filename), 'rb') as file:
+                self.assertEqual(file.read(), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
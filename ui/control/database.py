@@ -12,11 +12,14 @@ from lib.layer.security import ChangeRequestException, SecurityException
 from lib.model.employee import Employee
 from lib.model.receipt import Receipt
 from lib.model.timesheet import TimeSheet
+from lib.payroll.ledger import PayrollException
+from lib.repository.db import DatabaseRepository
 from lib.repository.validator import is_valid_against, ValidationException
 from lib.utils import sha_hash
 from ui import store
 from ui.control import Controller
 from ui.control.change_requests import ChangeRequestsController
+from ui.widgets.employee_picker import EMPLOYEE_PICKER_COLUMNS
 from ui.window.database import DatabaseWindow
 from ui.window.dialogs.about_empdat import AboutEmpDatDialog
 from ui.window.dialogs.add_receipt import AddReceiptDialog
@@ -24,6 +27,9 @@ from ui.window.dialogs.add_timesheet import AddTimesheetDialog
 from ui.window.dialogs.my_password import MyPasswordDialog
 from ui.window.dialogs.others_password import PasswordDialog
 
+EMPLOYEE_PAGE_SIZE = 500
+EMPLOYEE_FILTERS = {'id': [('!=', -1)]}  # hides the root account, like read_all
+
 
 def _open_change_requests():
     """
@@ -35,23 +41,24 @@ def _open_change_requests():
 
 def _on_password_save(view, dialog, employee_id, old_pass: str,  # pylint: disable=too-many-arguments
                       password: str, password_confirm: str, require_old=True):
-    employee = Employee.read(employee_id)
+    with DatabaseRepository.unit_of_work():
+        employee = Employee.read(employee_id)
 
-    if require_old and sha_hash(old_pass) != employee.password:
-        view.show_error('Error', 'Old password does not match!')
-        return
+        if require_old and sha_hash(old_pass) != employee.password:
+            view.show_error('Error', 'Old password does not match!')
+            return
 
-    if password != password_confirm:
-        view.show_error('Error', 'New Passwords do not match!')
-        return
+        if password != password_confirm:
+            view.show_error('Error', 'New Passwords do not match!')
+            return
 
-    if not is_valid_against('password', password):
-        view.show_error('Error', 'Passwords must have at least 9 characters (with at least '
-                                 '1 number, 1 special character, and upper and lowercase '
-                                 'characters)!')
-        return
+        if not is_valid_against('password', password):
+            view.show_error('Error', 'Passwords must have at least 9 characters (with at least '
+                                     '1 number, 1 special character, and upper and lowercase '
+                                     'characters)!')
+            return
 
-    Employee.read(employee_id).update_password(password)
+        Employee.read(employee_id).update_password(password)
 
     view.set_status('Changing password successful!')
     view.show_info('Info', 'Changing password successful!')
@@ -76,6 +83,7 @@ class DatabaseController(Controller):
             'save': self.save,
             'delete': self.delete,
             'refresh': self.refresh,
+            'load_more': self.load_more,
             'file>logout': self.logout,
             'import>employees': self.import_employees,
             'import>receipts': self.import_receipts,
@@ -88,18 +96,37 @@ class DatabaseController(Controller):
         }))
 
         self.new_id = 0
+        self.next_cursor = None
 
     def load(self):
         """
-        Loads all employees and displays them on the table
+        Loads the first page of employees and displays them on the table.
+        Later pages are loaded on demand, see load_more
+        :return: None
+        """
+        self._load_page()
+
+    def load_more(self):
+        """
+        When Load More is pressed. Appends the next page of employees
         :return: None
         """
-        employees = Employee.read_all()
-        i = 0
-        for employee in employees:
-            i += 1
+        if self.next_cursor is not None:
+            self._load_page(self.next_cursor)
+            self.view.table.redraw()
+
+    def _load_page(self, after=None):
+        """
+        Adds one page of employees to the table
+        :param after: cursor of the page, None for the first one
+        :return: None
+        """
+        page = Employee.read_by(EMPLOYEE_FILTERS, limit=EMPLOYEE_PAGE_SIZE, after=after)
+        for employee in page:
             self.view.add_to_result(employee.id,
                                     employee.to_view_model(security_layer=store.SECURITY_LAYER))
+        self.next_cursor = page.next_cursor
+        self.view.set_load_more_state('disabled' if page.next_cursor is None else 'normal')
 
         self.view.table.autoResizeColumns()
 
@@ -136,8 +163,15 @@ class DatabaseController(Controller):
             self.view.set_status('Payroll cancelled')
             return
 
-        run_payroll(filepath)
-        self.view.show_info('Success', f'Payroll was processed and was written to: {filepath}!')
+        # an interrupted run is resumed into its original file instead
+        try:
+            filepaths = run_payroll(filepath)
+        except PayrollException as error:
+            self.view.show_error('Payroll Failed', str(error))
+            self.view.set_status('Payroll failed')
+            return
+        self.view.show_info('Success',
+                            f'Payroll was processed and was written to: {", ".join(filepaths)}!')
         self.view.set_status('Payroll was processed successfully!')
 
     def save(self):
@@ -156,11 +190,13 @@ class DatabaseController(Controller):
                 is_new = True
 
             try:
-                employee = Employee.from_view_model(view_model)
-                if is_new:
-                    Employee.create(employee)
-                else:
-                    Employee.update(employee)
+                # from_view_model and the security layer both read the employee
+                with DatabaseRepository.unit_of_work():
+                    employee = Employee.from_view_model(view_model)
+                    if is_new:
+                        Employee.create(employee)
+                    else:
+                        Employee.update(employee)
             except ChangeRequestException:
                 change_request_submitted = True
             except SecurityException as error:
@@ -237,7 +273,7 @@ class DatabaseController(Controller):
 
         PasswordDialog({
             'save': on_save
-        }, Employee.read_all())
+        }, Employee.read_all(columns=EMPLOYEE_PICKER_COLUMNS))
 
     def import_employees(self):
         """
@@ -326,7 +362,7 @@ class DatabaseController(Controller):
 
         AddReceiptDialog({
             'save': on_save
-        }, Employee.read_all())
+        }, Employee.read_all(columns=EMPLOYEE_PICKER_COLUMNS))
 
     def new_timesheet(self):
         """
@@ -370,7 +406,7 @@ class DatabaseController(Controller):
 
         AddTimesheetDialog({
             'save': on_save
-        }, Employee.read_all())
+        }, Employee.read_all(columns=EMPLOYEE_PICKER_COLUMNS))
 
     def export_to_csv(self):
         """
@@ -3,6 +3,9 @@ Employee picker for Tkinter
 """
 from tkinter.ttk import OptionMenu
 
+# the only Employee columns the picker needs. See DatabaseRepository._select
+EMPLOYEE_PICKER_COLUMNS = ['id', 'first_name', 'last_name']
+
 
 def _format_employees(employees):
     employees.sort(key=lambda x: x.last_name)
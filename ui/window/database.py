@@ -28,6 +28,8 @@ class DatabaseWindow(TkinterWindow):  # pylint: disable=too-many-instance-attrib
             'run_payroll'
             'save'
             'delete'
+            'refresh'
+            'load_more'
             'file>logout'
             'import>employees'
             'import>receipts'
@@ -203,6 +205,12 @@ class DatabaseWindow(TkinterWindow):  # pylint: disable=too-many-instance-attrib
                                                                 and self.show_confirm(
                 'Are you sure?', 'There are unsaved changes. Refresh anyway?') else None,
         )
+        self.load_more_button = Button(
+            buttons,
+            text="Load More",
+            state="disabled",
+            command=self.event_handlers['load_more'],
+        )
         self.search_button = Button(
             buttons,
             text="Search",
@@ -224,6 +232,7 @@ class DatabaseWindow(TkinterWindow):  # pylint: disable=too-many-instance-attrib
         if store.SECURITY_LAYER.can_create('employee'):
             self.new_button.pack(side=LEFT, anchor=W)
         self.refresh_button.pack(side=LEFT, anchor=W)
+        self.load_more_button.pack(side=LEFT, anchor=W)
         Label(buttons,
               text=f"({store.SECURITY_LAYER.user.first_name} "
               f"{store.SECURITY_LAYER.user.last_name})") \
@@ -301,6 +310,14 @@ class DatabaseWindow(TkinterWindow):  # pylint: disable=too-many-instance-attrib
         """
         self.save_button['state'] = state
 
+    def set_load_more_state(self, state):
+        """
+        Sets state of the load more button
+        :param state: tkinter button state
+        :return: None
+        """
+        self.load_more_button['state'] = state
+
     def set_delete_state(self, state):
         """
         Sets state of the delete button